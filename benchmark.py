@@ -0,0 +1,265 @@
+"""
+Dance Skeleton Benchmark
+------------------------
+Generates deterministic synthetic dance videos, runs ``DanceSkeletonProcessor.process_video``
+on each and reports throughput, per-stage timings, peak RSS and output size as JSON.
+
+    python benchmark.py run --output bench.json                # full suite
+    python benchmark.py run --quick --baseline bench.json      # compare against a stored run
+    python benchmark.py run --set pose_stride=3 --set output_mode=overlay
+    python benchmark.py compare old.json new.json
+
+Each scenario runs in a fresh worker process so peak RSS is per run and no MediaPipe
+tracking state leaks between scenarios. ``compare`` (and ``run --baseline``) exits with
+status 1 if any scenario regressed by more than ``--threshold``.
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional
+
+import cv2
+import numpy as np
+
+from main import DanceSkeletonProcessor
+
+
+class Scenario(NamedTuple):
+    name: str
+    width: int
+    height: int
+    frames: int
+    fps: float
+    person: bool
+
+
+SCENARIOS = [
+    Scenario("720p_person", 1280, 720, 150, 30, True),
+    Scenario("720p_empty", 1280, 720, 150, 30, False),
+    Scenario("1080p_person", 1920, 1080, 120, 30, True),
+    Scenario("portrait_person", 720, 1280, 120, 25, True),
+    Scenario("480p_long", 854, 480, 600, 30, True),
+]
+QUICK_FRAMES = 30
+
+# Higher is better for these; everything else compared is lower-is-better
+HIGHER_IS_BETTER = {"fps"}
+COMPARED = ("fps", "peak_rss_mb", "output_bytes")
+
+
+def _draw_dancer(frame: np.ndarray, t: float):
+    """Draws a flat-shaded figure MediaPipe reliably detects, arms and legs swinging with ``t``."""
+    h, w = frame.shape[:2]
+    s = h / 720
+    cx = w / 2 + np.sin(2 * np.pi * t / 3) * w * 0.1
+    swing = np.sin(2 * np.pi * t) * 40
+    skin, shirt, pants, hair = (140, 170, 215), (60, 60, 170), (90, 60, 40), (30, 30, 40)
+
+    def p(x, y):
+        return int(cx + x * s), int(y * s)
+
+    for side in (-1, 1):
+        knee = p(side * (45 + swing * 0.3 * -side), 560)
+        cv2.line(frame, p(side * 25, 420), knee, pants, int(34 * s))
+        cv2.line(frame, knee, p(side * 50, 690), pants, int(30 * s))
+        elbow = p(side * 110, 300 + side * swing)
+        cv2.line(frame, p(side * 60, 200), elbow, shirt, int(26 * s))
+        cv2.line(frame, elbow, p(side * 130, 390 + side * 2 * swing), skin, int(22 * s))
+    cv2.fillPoly(frame, [np.array([p(-60, 190), p(60, 190), p(45, 430), p(-45, 430)])], shirt)
+    cv2.line(frame, p(0, 150), p(0, 195), skin, int(26 * s))
+    cv2.ellipse(frame, p(0, 110), (int(38 * s), int(48 * s)), 0, 0, 360, skin, -1)
+    cv2.ellipse(frame, p(0, 85), (int(40 * s), int(28 * s)), 0, 180, 360, hair, -1)
+    for eye in (-14, 14):
+        cv2.circle(frame, p(eye, 108), max(2, int(4 * s)), hair, -1)
+
+
+def generate_video(scenario: Scenario, directory: Path) -> Path:
+    """Writes the scenario's video once; the same parameters always give the same file."""
+    frames = scenario.frames
+    path = directory / (
+        f"{scenario.width}x{scenario.height}_{frames}f_{scenario.fps:g}fps_{'person' if scenario.person else 'empty'}.mp4"
+    )
+    if path.exists():
+        return path
+    # Fixed-seed texture so decode/encode see realistic detail rather than flat colour
+    rng = np.random.default_rng(0)
+    background = np.full((scenario.height, scenario.width, 3), (200, 190, 180), dtype=np.uint8)
+    background += rng.integers(0, 24, background.shape, dtype=np.uint8)
+    writer = cv2.VideoWriter(
+        str(path), cv2.VideoWriter_fourcc(*"mp4v"), scenario.fps, (scenario.width, scenario.height)
+    )
+    frame = np.empty_like(background)
+    for i in range(frames):
+        np.copyto(frame, background)
+        if scenario.person:
+            _draw_dancer(frame, i / scenario.fps)
+        writer.write(frame)
+    writer.release()
+    return path
+
+
+def _peak_rss_mb() -> float:
+    """Peak resident set size of this process (ru_maxrss is KiB on Linux, bytes on macOS)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _run_scenario(video_path: str, output_path: str, options: dict) -> dict:
+    """Runs in a fresh worker process: processes one video and measures it."""
+    processor = DanceSkeletonProcessor()
+    try:
+        processor.warm_up()
+        started = time.perf_counter()
+        info = processor.process_video(video_path, output_path, stage_timings=True, **options)
+        seconds = time.perf_counter() - started
+    finally:
+        processor.close()
+    output_bytes = os.path.getsize(output_path) if os.path.exists(output_path) else 0
+    return {
+        "seconds": round(seconds, 3),
+        "fps": round(info["frames"] / seconds, 2),
+        "frames": info["frames"],
+        "detection_rate": round(info["processed_frames"] / info["frames"], 3) if info["frames"] else 0,
+        "pose_inferences": info["pose_inferences"],
+        "encoder": info["encoder"],
+        "output_bytes": output_bytes,
+        "peak_rss_mb": _peak_rss_mb(),
+        "timings": info["timings"],
+    }
+
+
+def _parse_options(pairs: List[str]) -> dict:
+    """``key=value`` overrides for process_video; values are parsed as JSON when possible."""
+    options = {}
+    for pair in pairs:
+        key, _, value = pair.partition("=")
+        try:
+            options[key] = json.loads(value)
+        except ValueError:
+            options[key] = value
+    return options
+
+
+def run(
+    scenarios: List[Scenario], options: dict, repeat: int = 1, workdir: Optional[Path] = None
+) -> dict:
+    """Benchmarks every scenario, keeping the median-fps run of ``repeat`` for each."""
+    workdir = workdir or Path(tempfile.gettempdir()) / "dance-benchmark"
+    workdir.mkdir(parents=True, exist_ok=True)
+    results = []
+    for scenario in scenarios:
+        video = generate_video(scenario, workdir)
+        runs = []
+        for _ in range(repeat):
+            output = workdir / f"{scenario.name}_out.mp4"
+            output.unlink(missing_ok=True)
+            with ProcessPoolExecutor(1, mp_context=get_context("spawn")) as pool:
+                runs.append(pool.submit(_run_scenario, str(video), str(output), options).result())
+        runs.sort(key=lambda r: r["fps"])
+        video_params = scenario._asdict()
+        del video_params["name"]
+        result = {"scenario": scenario.name, "video": video_params, **runs[len(runs) // 2]}
+        results.append(result)
+        print(
+            f"{scenario.name:<18} {result['fps']:>7.1f} fps  {result['peak_rss_mb']:>7.1f} MB  "
+            f"{result['output_bytes'] / 1e6:>7.2f} MB out  detection {result['detection_rate']:.0%}",
+            file=sys.stderr,
+        )
+    return {"meta": _environment(options, repeat), "results": results}
+
+
+def _environment(options: dict, repeat: int) -> dict:
+    try:
+        import mediapipe
+        mediapipe_version = mediapipe.__version__
+    except ImportError:
+        mediapipe_version = None
+    return {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "mediapipe": mediapipe_version,
+        "options": options,
+        "repeat": repeat,
+    }
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> List[str]:
+    """Prints a per-scenario comparison and returns the regressions beyond ``threshold``."""
+    previous: Dict[str, dict] = {r["scenario"]: r for r in baseline["results"]}
+    regressions = []
+    for result in current["results"]:
+        before = previous.get(result["scenario"])
+        if before is None:
+            continue
+        for metric in COMPARED:
+            old, new = before[metric], result[metric]
+            if not old:
+                continue
+            change = (new - old) / old
+            worse = -change if metric in HIGHER_IS_BETTER else change
+            flag = "REGRESSION" if worse > threshold else ""
+            print(f"{result['scenario']:<18} {metric:<13} {old:>12g} -> {new:>12g}  {change:+7.1%}  {flag}")
+            if flag:
+                regressions.append(f"{result['scenario']} {metric} {change:+.1%}")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="run the benchmark suite")
+    run_parser.add_argument("--output", type=Path, help="write results JSON here (default: stdout)")
+    run_parser.add_argument("--baseline", type=Path, help="compare against a stored results JSON")
+    run_parser.add_argument("--threshold", type=float, default=0.10, help="allowed relative regression")
+    run_parser.add_argument("--scenario", action="append", help="only run these scenarios")
+    run_parser.add_argument("--quick", action="store_true", help=f"cap every video at {QUICK_FRAMES} frames")
+    run_parser.add_argument("--repeat", type=int, default=1, help="runs per scenario (median is kept)")
+    run_parser.add_argument("--set", action="append", default=[], metavar="KEY=VALUE",
+                            help="process_video option, e.g. pose_stride=3")
+    run_parser.add_argument("--workdir", type=Path, help="where synthetic videos are cached")
+
+    compare_parser = commands.add_parser("compare", help="compare two results files")
+    compare_parser.add_argument("baseline", type=Path)
+    compare_parser.add_argument("current", type=Path)
+    compare_parser.add_argument("--threshold", type=float, default=0.10)
+
+    args = parser.parse_args(argv)
+    if args.command == "compare":
+        baseline, current = (json.loads(p.read_text()) for p in (args.baseline, args.current))
+    else:
+        scenarios = [s for s in SCENARIOS if not args.scenario or s.name in args.scenario]
+        if args.quick:
+            scenarios = [s._replace(frames=min(s.frames, QUICK_FRAMES)) for s in scenarios]
+        current = run(scenarios, _parse_options(args.set), max(1, args.repeat), args.workdir)
+        report = json.dumps(current, indent=2)
+        if args.output:
+            args.output.write_text(report + "\n")
+        else:
+            print(report)
+        if not args.baseline:
+            return 0
+        baseline = json.loads(args.baseline.read_text())
+
+    regressions = compare(baseline, current, args.threshold)
+    if regressions:
+        print(f"{len(regressions)} regression(s): " + "; ".join(regressions), file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
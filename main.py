@@ -4,31 +4,85 @@ FastAPI Dance Skeleton Application (Docker-safe)
 Processes dance videos and displays original + skeleton side-by-side.
 """
 import os
-import cv2
+import asyncio
+import hashlib
+import importlib
+import importlib.util
+import io
+import json
+import logging
+import math
+import multiprocessing
+import queue
 import numpy as np
 import shutil
+import subprocess
+import threading
+import time
 import uuid
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass, field
+from functools import partial
 from pathlib import Path
-from typing import List, Tuple
+from typing import (
+    Callable, Deque, Dict, Hashable, List, Literal, MutableMapping, NamedTuple, Optional, Set, Tuple, get_args,
+)
 
-from fastapi import FastAPI, File, UploadFile, HTTPException, Request
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, File, Form, UploadFile, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
+from pydantic import BaseModel
+from starlette.datastructures import Headers
 
 # ✅ Run OpenCV & MediaPipe in headless mode (no GUI)
 os.environ["QT_QPA_PLATFORM"] = "offscreen"
 
-# ✅ Import MediaPipe safely
-try:
-    import mediapipe as mp
-    _HAS_MEDIAPIPE = True
-except ImportError:
-    mp = None
-    _HAS_MEDIAPIPE = False
+# Per-process start-up costs in seconds (heavy imports, model load), reported by /health/ready
+_startup_timings: Dict[str, float] = {}
+
+
+class _LazyModule:
+    """Imports a module on first attribute access and records how long the import took.
+
+    OpenCV and MediaPipe take seconds to import; deferring them lets the API answer
+    /health/live straight away and leaves the cost to the workers that actually need them.
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr: str):
+        if self._module is None:
+            started = time.perf_counter()
+            module = importlib.import_module(self._name)
+            _startup_timings.setdefault(f"import_{self._name}_s", round(time.perf_counter() - started, 3))
+            self._module = module
+        return getattr(self._module, attr)
+
+
+cv2 = _LazyModule("cv2")
+
+# ✅ MediaPipe is optional at import time; only processing needs it
+_HAS_MEDIAPIPE = importlib.util.find_spec("mediapipe") is not None
+mp = _LazyModule("mediapipe") if _HAS_MEDIAPIPE else None
+
+# ✅ pyarrow (in requirements.txt) is only needed for Parquet keypoint exports; without it they answer 501
+_HAS_PYARROW = importlib.util.find_spec("pyarrow") is not None
+pa = _LazyModule("pyarrow") if _HAS_PYARROW else None
+pq = _LazyModule("pyarrow.parquet") if _HAS_PYARROW else None
 
 
 Keypoint = Tuple[float, float, float]
+# (33, 4) float32 array of MediaPipe landmarks: normalised x, y, z and visibility
+Landmarks = np.ndarray
+
+# Shares uvicorn's handlers and level, so job logs show up next to the access log
+logger = logging.getLogger("uvicorn.error").getChild("dance")
 
 # ✅ Absolute paths for Docker consistency
 BASE_DIR = Path(__file__).resolve().parent
@@ -37,7 +91,134 @@ PROCESSED_DIR = BASE_DIR / "processed"
 UPLOAD_DIR.mkdir(exist_ok=True)
 PROCESSED_DIR.mkdir(exist_ok=True)
 
-app = FastAPI(title="Dance Analyzer")
+# ✅ Result cache: identical uploads processed with identical settings reuse the earlier output
+RESULT_CACHE = os.getenv("RESULT_CACHE", "true").lower() in ("1", "true", "yes")
+CACHE_DIR = Path(os.getenv("CACHE_DIR", str(PROCESSED_DIR / "cache")))
+CACHE_DIR.mkdir(parents=True, exist_ok=True)
+
+# ✅ Worker pool: "process" isolates MediaPipe per core, "thread" shares one process
+EXECUTION_MODE = os.getenv("EXECUTION_MODE", "process").lower()
+PROCESS_WORKERS = max(1, int(os.getenv("PROCESS_WORKERS", "2")))
+
+# ✅ Admission control: jobs processed at once, jobs waiting (uploads in progress included) and each
+#    client's share of both; beyond that uploads get 503 / 429 with Retry-After before the body is read
+MAX_RUNNING_JOBS = max(1, int(os.getenv("MAX_RUNNING_JOBS", str(PROCESS_WORKERS))))
+MAX_QUEUED_JOBS = max(0, int(os.getenv("MAX_QUEUED_JOBS", "16")))
+MAX_JOBS_PER_CLIENT = max(1, int(os.getenv("MAX_JOBS_PER_CLIENT", "4")))
+# Header identifying clients behind a proxy (e.g. X-Real-IP or an API key); default: peer address
+CLIENT_ID_HEADER = os.getenv("CLIENT_ID_HEADER", "")
+
+# ✅ Job bookkeeping: progress report interval and how long finished jobs are kept
+PROGRESS_INTERVAL = float(os.getenv("PROGRESS_INTERVAL", "0.5"))
+JOB_TTL_SECONDS = float(os.getenv("JOB_TTL_SECONDS", "3600"))
+
+# ✅ Progress event stream: idle seconds between keep-alive comments, so proxies keep it open
+SSE_KEEPALIVE_SECONDS = float(os.getenv("SSE_KEEPALIVE_SECONDS", "15"))
+
+# ✅ MediaPipe pose model: 0 = lite, 1 = full, 2 = heavy
+MODEL_COMPLEXITY = int(os.getenv("MODEL_COMPLEXITY", "1"))
+
+# ✅ Time every pipeline stage per frame and report p50/p95/max in the job info
+STAGE_TIMINGS = os.getenv("STAGE_TIMINGS", "false").lower() in ("1", "true", "yes")
+
+# ✅ Frames buffered between the decode -> pose -> encode pipeline stages
+PIPELINE_QUEUE_DEPTH = max(1, int(os.getenv("PIPELINE_QUEUE_DEPTH", "8")))
+
+# ✅ Split long videos into segments processed in parallel (0 = off); warm-up frames re-seed tracking
+SEGMENT_SECONDS = float(os.getenv("SEGMENT_SECONDS", "0"))
+SEGMENT_WARMUP_FRAMES = max(0, int(os.getenv("SEGMENT_WARMUP_FRAMES", "15")))
+
+# ✅ Longest side of the frame copy handed to MediaPipe (0 = full resolution); output keeps full size
+INFERENCE_MAX_SIDE = max(0, int(os.getenv("INFERENCE_MAX_SIDE", "640")))
+
+# ✅ Run pose detection every Nth frame and interpolate in between; adaptive mode falls back
+#    to every frame while landmarks move faster than the threshold (normalised units per frame)
+POSE_STRIDE = max(1, int(os.getenv("POSE_STRIDE", "1")))
+ADAPTIVE_STRIDE = os.getenv("ADAPTIVE_STRIDE", "true").lower() in ("1", "true", "yes")
+MOTION_THRESHOLD = float(os.getenv("MOTION_THRESHOLD", "0.01"))
+
+# ✅ Output video layout; "none" only saves landmarks and skips encoding entirely
+OutputMode = Literal["side_by_side", "overlay", "skeleton_only", "none"]
+OUTPUT_MODES = get_args(OutputMode)
+OUTPUT_MODE = os.getenv("OUTPUT_MODE", "side_by_side").lower()
+
+# ✅ Landmarks below this visibility are not drawn
+VISIBILITY_THRESHOLD = float(os.getenv("VISIBILITY_THRESHOLD", "0.5"))
+
+# ✅ Keep each source video (named by its hash) so outputs can be re-rendered from cached landmarks;
+#    kept outside the statically served folders and evicted with the jobs after JOB_TTL_SECONDS
+KEEP_SOURCES = os.getenv("KEEP_SOURCES", "true").lower() in ("1", "true", "yes")
+SOURCE_DIR = BASE_DIR / "sources"
+SOURCE_DIR.mkdir(exist_ok=True)
+
+# ✅ Caption band on the output: "Original"/"Skeleton" labels, optional frame counter and timestamp
+OVERLAY_LABELS = os.getenv("OVERLAY_LABELS", "true").lower() in ("1", "true", "yes")
+OVERLAY_FRAME_COUNTER = os.getenv("OVERLAY_FRAME_COUNTER", "false").lower() in ("1", "true", "yes")
+OVERLAY_TIMESTAMP = os.getenv("OVERLAY_TIMESTAMP", "false").lower() in ("1", "true", "yes")
+
+# ✅ Uploads are copied in chunks off the event loop and rejected once they exceed the cap
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_MB", "500")) * 1024 * 1024
+
+# ✅ Output encoder: "ffmpeg" (libx264 + faststart), "opencv" (mp4v) or "auto" (ffmpeg if installed)
+VIDEO_ENCODER = os.getenv("VIDEO_ENCODER", "auto").lower()
+X264_PRESET = os.getenv("X264_PRESET", "veryfast")
+X264_CRF = int(os.getenv("X264_CRF", "23"))
+
+# ✅ Per-job memory budget in MB (0 = off): jobs estimated above it are downscaled until they fit
+#    ("downscale") or turned away with 413 ("reject"); each job records its actual peak RSS
+JOB_MEMORY_BUDGET_MB = float(os.getenv("JOB_MEMORY_BUDGET_MB", "1024"))
+MEMORY_POLICY = os.getenv("MEMORY_POLICY", "downscale").lower()
+MIN_DOWNSCALED_SIDE = 240
+
+# ✅ Live webcam streaming: concurrent sessions, each holding its own warm MediaPipe tracker
+LIVE_MAX_SESSIONS = int(os.getenv("LIVE_MAX_SESSIONS", "2"))
+
+# ✅ Per-frame inference budget for live sessions in ms (0 = off); over budget a session lowers the
+#    inference resolution, then switches to the lite model, then skips frames until it fits again
+LIVE_LATENCY_BUDGET_MS = float(os.getenv("LIVE_LATENCY_BUDGET_MS", "50"))
+
+
+def _create_executor() -> Executor:
+    """Creates the pool that runs video processing off the event loop."""
+    if EXECUTION_MODE == "process":
+        # spawn avoids forking a parent that may already hold MediaPipe/OpenCV threads
+        return ProcessPoolExecutor(
+            max_workers=PROCESS_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_processor_pool,
+            initargs=(1,),
+        )
+    if EXECUTION_MODE == "thread":
+        return ThreadPoolExecutor(max_workers=PROCESS_WORKERS, thread_name_prefix="dance-worker")
+    raise ValueError(f"Unknown EXECUTION_MODE: {EXECUTION_MODE!r} (expected 'process' or 'thread')")
+
+
+def _create_progress_store() -> Tuple[MutableMapping, Optional[object]]:
+    """Creates the job_id -> (frames_done, total_frames) map shared with the workers."""
+    if EXECUTION_MODE == "process":
+        manager = multiprocessing.get_context("spawn").Manager()
+        return manager.dict(), manager
+    return {}, None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.executor = _create_executor()
+    app.state.progress, app.state.manager = _create_progress_store()
+    # Warm up in the background so the server accepts connections (and /health/live) immediately
+    app.state.readiness = {"ready": False, "error": None}
+    app.state.warm_up = asyncio.create_task(_warm_up_workers(app))
+    try:
+        yield
+    finally:
+        app.state.warm_up.cancel()
+        app.state.executor.shutdown(wait=False, cancel_futures=True)
+        if app.state.manager is not None:
+            app.state.manager.shutdown()
+
+
+app = FastAPI(title="Dance Analyzer", lifespan=lifespan)
 templates = Jinja2Templates(directory=str(BASE_DIR / "templates"))
 
 # ✅ Serve static folders
@@ -45,45 +226,682 @@ app.mount("/uploads", StaticFiles(directory=UPLOAD_DIR), name="uploads")
 app.mount("/processed", StaticFiles(directory=PROCESSED_DIR), name="processed")
 
 
+class _UploadSizeLimit:
+    """Rejects POST bodies over the upload cap with 413 while they stream in.
+
+    Content-Length is checked before anything is read. Chunked bodies have none, so their
+    bytes are counted as they arrive and the request is cut off at the cap rather than
+    being spooled to disk in full first.
+    """
+
+    def __init__(self, app, max_bytes: int):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST":
+            return await self.app(scope, receive, send)
+        length = Headers(scope=scope).get("content-length")
+        if length and length.isdigit() and int(length) > self.max_bytes:
+            response = JSONResponse(status_code=413, content={"detail": _upload_too_large().detail})
+            return await response(scope, receive, send)
+        received = 0
+
+        async def receive_limited():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    # FastAPI re-raises HTTPExceptions from body parsing, so this becomes the response
+                    raise _upload_too_large()
+            return message
+
+        await self.app(scope, receive_limited, send)
+
+
+# Chunk-size slack covers the multipart framing around the file
+app.add_middleware(_UploadSizeLimit, max_bytes=MAX_UPLOAD_BYTES + UPLOAD_CHUNK_SIZE)
+
+
+@app.middleware("http")
+async def admission_control(request: Request, call_next):
+    """Reserves a job place for uploads before their body is read; the endpoint hands it to the job."""
+    if request.method != "POST" or request.url.path not in ("/process", "/jobs"):
+        return await call_next(request)
+    client = _client_id(request)
+    try:
+        _admission.admit(client)
+    except HTTPException as e:
+        return JSONResponse(status_code=e.status_code, content={"detail": e.detail}, headers=e.headers)
+    request.state.admission = client
+    try:
+        return await call_next(request)
+    finally:
+        # Still set if the request failed before a job took the place over
+        if request.state.admission is not None:
+            _admission.release(client)
+
+
+def _put_frame(frames: queue.Queue, item, stop: threading.Event) -> bool:
+    """Puts an item on a bounded stage queue, giving up once the pipeline is stopping."""
+    while not stop.is_set():
+        try:
+            frames.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _get_frame(frames: queue.Queue, stop: threading.Event):
+    """Takes the next item from a stage queue, or None once the pipeline is stopping."""
+    while not stop.is_set():
+        try:
+            return frames.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return None
+
+
+class _FrameSlot(NamedTuple):
+    """One output frame buffer and the views the pipeline stages fill in place."""
+    canvas: Optional[np.ndarray]    # what the encoder writes
+    frame: np.ndarray               # decoded frame, read directly into the canvas where it is shown
+    skeleton: Optional[np.ndarray]  # where the skeleton is drawn
+
+
+class _FramePool:
+    """Recycles output frame buffers between the pipeline stages.
+
+    Buffers are allocated on demand up to ``capacity`` and reused after that, so the
+    steady state allocates nothing per frame. ``layout`` is the output mode the
+    slots are arranged for.
+    """
+
+    def __init__(self, height: int, width: int, capacity: int, layout: str = "side_by_side"):
+        self._height = height
+        self._width = width
+        self._capacity = capacity
+        self._layout = layout
+        self._allocated = 0
+        self._free: queue.Queue = queue.Queue()
+
+    def acquire(self, stop: threading.Event) -> Optional[_FrameSlot]:
+        try:
+            return self._free.get_nowait()
+        except queue.Empty:
+            pass
+        if self._allocated < self._capacity:
+            self._allocated += 1
+            return self._allocate()
+        return _get_frame(self._free, stop)
+
+    def _allocate(self) -> _FrameSlot:
+        if self._layout == "side_by_side":
+            canvas = np.zeros((self._height, self._width * 2, 3), dtype=np.uint8)
+            return _FrameSlot(canvas, canvas[:, :self._width], canvas[:, self._width:])
+        frame = np.zeros((self._height, self._width, 3), dtype=np.uint8)
+        if self._layout == "overlay":
+            return _FrameSlot(frame, frame, frame)
+        if self._layout == "skeleton_only":
+            skeleton = np.zeros_like(frame)
+            return _FrameSlot(skeleton, frame, skeleton)
+        return _FrameSlot(None, frame, None)
+
+    def release(self, slot: _FrameSlot):
+        self._free.put(slot)
+
+
+class _HeaderOverlay:
+    """Caption band drawn on every output frame, rasterised once per video.
+
+    The text is drawn without anti-aliasing in a single colour, so it is fully described
+    by the pixels it covers. Labels are rasterised once into flat pixel indices, and the
+    optional frame counter and timestamp are assembled from cached per-position glyph
+    indices, so each frame costs one indexed store and cv2.putText never runs in the
+    frame loop.
+    """
+
+    FONT = 0  # cv2.FONT_HERSHEY_SIMPLEX, spelled out so defining the class doesn't import cv2
+    SCALE = 1
+    THICKNESS = 2
+    COLOR = (255, 255, 255)
+    BASELINE_Y = 30
+    GLYPHS = "0123456789:.# "
+
+    def __init__(
+        self,
+        canvas_shape: Tuple[int, ...],
+        labels: List[Tuple[str, int]],
+        fps: float,
+        first_frame: int = 0,
+        frame_counter: bool = False,
+        timestamp: bool = False,
+    ):
+        height, width = canvas_shape[:2]
+        _, baseline = cv2.getTextSize("Ag", self.FONT, self.SCALE, self.THICKNESS)
+        self._band_height = min(height, self.BASELINE_Y + baseline + self.THICKNESS)
+        self._width = width
+        self._fps = fps
+        self._first_frame = first_frame
+        self._frame_counter = frame_counter
+        self._timestamp = timestamp
+        self._color = np.array(self.COLOR, dtype=np.uint8)
+
+        ys, xs = self._rasterise(labels, width)
+        self._static = ys * width + xs
+        self._glyphs: Dict[str, Tuple[int, np.ndarray, np.ndarray]] = {}
+        self._placed: Dict[Tuple[str, int], np.ndarray] = {}
+        if frame_counter or timestamp:
+            for char in self.GLYPHS:
+                (advance, _), _ = cv2.getTextSize(char, self.FONT, self.SCALE, self.THICKNESS)
+                ys, xs = self._rasterise([(char, self.THICKNESS)], advance + 2 * self.THICKNESS)
+                self._glyphs[char] = (advance, ys, xs - self.THICKNESS)
+
+    def _rasterise(self, texts: List[Tuple[str, int]], width: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Pixel coordinates (rows, cols) covered by ``texts`` drawn at their x offsets."""
+        band = np.zeros((self._band_height, width), dtype=np.uint8)
+        for text, x in texts:
+            cv2.putText(band, text, (x, self.BASELINE_Y), self.FONT, self.SCALE, 255, self.THICKNESS)
+        return np.nonzero(band)
+
+    def _place(self, char: str, x: int) -> np.ndarray:
+        """Flat pixel indices of a glyph drawn at x; the layout is fixed, so this is cached."""
+        placed = self._placed.get((char, x))
+        if placed is None:
+            _, ys, xs = self._glyphs[char]
+            xs = xs + x
+            inside = (xs >= 0) & (xs < self._width)
+            placed = self._placed[(char, x)] = ys[inside] * self._width + xs[inside]
+        return placed
+
+    def _dynamic_text(self, frame_index: int) -> str:
+        parts = []
+        if self._timestamp:
+            minutes, seconds = divmod(frame_index / self._fps, 60)
+            parts.append(f"{int(minutes):02d}:{seconds:05.2f}")
+        if self._frame_counter:
+            parts.append(f"#{frame_index:06d}")
+        return "  ".join(parts)
+
+    def apply(self, canvas: np.ndarray, frame_number: int):
+        """Draws the band onto a C-contiguous output frame.
+
+        ``frame_number`` counts from the first written frame.
+        """
+        pixels = self._static
+        if self._glyphs:
+            text = self._dynamic_text(self._first_frame + frame_number)
+            x = self._width - 10 - sum(self._glyphs[c][0] for c in text)
+            parts = [pixels]
+            for char in text:
+                parts.append(self._place(char, x))
+                x += self._glyphs[char][0]
+            pixels = np.concatenate(parts)
+        canvas.reshape(-1, 3)[pixels] = self._color
+
+
+class OpenCVVideoWriter:
+    """Writes frames with cv2.VideoWriter and the mp4v codec."""
+
+    name = "opencv"
+
+    def __init__(self, output_path: str, fps: float, size: Tuple[int, int]):
+        # ✅ Use mp4v instead of avc1 (more reliable in Docker)
+        fourcc = cv2.VideoWriter_fourcc(*"mp4v")
+        self._writer = cv2.VideoWriter(str(output_path), fourcc, fps, size)
+        if not self._writer.isOpened():
+            raise RuntimeError(f"Cannot create video writer: {output_path}")
+
+    def write(self, frame: np.ndarray):
+        self._writer.write(frame)
+
+    def release(self):
+        self._writer.release()
+
+
+class FFmpegVideoWriter:
+    """Pipes raw BGR frames into an ffmpeg subprocess encoding H.264.
+
+    Output is libx264 with the given preset/CRF, yuv420p for browser compatibility
+    and ``+faststart`` so playback can begin before the file is fully downloaded.
+    """
+
+    name = "ffmpeg"
+
+    def __init__(
+        self, output_path: str, fps: float, size: Tuple[int, int],
+        preset: str = X264_PRESET, crf: int = X264_CRF,
+    ):
+        ffmpeg = shutil.which("ffmpeg")
+        if ffmpeg is None:
+            raise RuntimeError("ffmpeg not installed in container.")
+        width, height = size
+        self._frame_bytes = width * height * 3
+        self._process = subprocess.Popen(
+            [ffmpeg, "-y", "-loglevel", "error",
+             "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{width}x{height}", "-r", str(fps),
+             "-i", "-", "-an",
+             "-c:v", "libx264", "-preset", preset, "-crf", str(crf),
+             # yuv420p needs even dimensions
+             "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2", "-pix_fmt", "yuv420p",
+             "-movflags", "+faststart", str(output_path)],
+            stdin=subprocess.PIPE, stderr=subprocess.PIPE,
+        )
+
+    def write(self, frame: np.ndarray):
+        if frame.nbytes != self._frame_bytes:
+            raise ValueError(f"Frame of {frame.nbytes} bytes, expected {self._frame_bytes}")
+        try:
+            # memoryview avoids a tobytes() copy of every frame
+            self._process.stdin.write(memoryview(np.ascontiguousarray(frame)))
+        except BrokenPipeError:
+            raise RuntimeError(f"ffmpeg exited early: {self._stderr()}") from None
+
+    def release(self):
+        if self._process.stdin and not self._process.stdin.closed:
+            try:
+                self._process.stdin.close()
+            except BrokenPipeError:
+                pass
+        if self._process.wait() != 0:
+            raise RuntimeError(f"ffmpeg failed: {self._stderr()}")
+
+    def _stderr(self) -> str:
+        return self._process.stderr.read().decode(errors="replace").strip()
+
+
+def _resolve_encoder(encoder: str) -> str:
+    """"auto" means ffmpeg when it is installed, OpenCV otherwise."""
+    if encoder == "auto":
+        return "ffmpeg" if shutil.which("ffmpeg") else "opencv"
+    return encoder
+
+
+def create_video_writer(
+    output_path: str, fps: float, size: Tuple[int, int],
+    encoder: str = VIDEO_ENCODER, preset: str = X264_PRESET, crf: int = X264_CRF,
+):
+    """Opens the writer backend for ``encoder`` ("ffmpeg", "opencv" or "auto")."""
+    encoder = _resolve_encoder(encoder)
+    if encoder == "ffmpeg":
+        return FFmpegVideoWriter(output_path, fps, size, preset=preset, crf=crf)
+    if encoder == "opencv":
+        return OpenCVVideoWriter(output_path, fps, size)
+    raise ValueError(f"Unknown encoder: {encoder!r} (expected 'ffmpeg', 'opencv' or 'auto')")
+
+
+# Resident bytes per output pixel measured for each encoder: libx264 (in its own ffmpeg
+# process) holds lookahead and frame-thread buffers, OpenCV's mp4v writer a few frames
+ENCODER_BYTES_PER_PIXEL = {"ffmpeg": 140, "opencv": 20}
+# Stored landmarks per frame, plus threads, caption band and MediaPipe scratch per job
+TRACK_BYTES_PER_FRAME = 1200
+JOB_OVERHEAD_BYTES = 16 * 1024 * 1024
+
+
+def estimate_job_memory(
+    source_size: Tuple[int, int],
+    frame_size: Tuple[int, int],
+    frames: int,
+    output_mode: str = OUTPUT_MODE,
+    encoder: str = VIDEO_ENCODER,
+    queue_depth: int = PIPELINE_QUEUE_DEPTH,
+    pose_stride: int = POSE_STRIDE,
+    inference_max_side: int = INFERENCE_MAX_SIDE,
+) -> Dict[str, int]:
+    """Expected peak working set of ``process_video`` in bytes, by component.
+
+    Mirrors its allocations: a full frame pool at ``frame_size``, the decoder's frames at
+    ``source_size``, the inference copy and the encoder's buffers. The loaded model is not
+    included; it is part of every worker's baseline.
+    """
+    (source_width, source_height), (width, height) = source_size, frame_size
+    frame = width * height * 3
+    source_frame = source_width * source_height * 3
+    slots = 2 * queue_depth + max(1, pose_stride) + 2
+    scale = min(1.0, inference_max_side / max(width, height, 1)) if inference_max_side else 1.0
+    output_width = 2 * width if output_mode == "side_by_side" else width
+    return {
+        "frame_pool": slots * frame * (2 if output_mode in ("side_by_side", "skeleton_only") else 1),
+        "decoder": 3 * source_frame + (source_frame if source_size != frame_size else 0),
+        "inference": 2 * int(frame * scale * scale),
+        "encoder": 0 if output_mode == "none" else (
+            output_width * height * ENCODER_BYTES_PER_PIXEL.get(_resolve_encoder(encoder), 0)
+        ),
+        "landmarks": frames * TRACK_BYTES_PER_FRAME,
+        "overhead": JOB_OVERHEAD_BYTES,
+    }
+
+
+class _StageTimings:
+    """Per-frame durations of each pipeline stage, summarised as percentiles.
+
+    Every stage is appended to from a single thread, so no locking is needed. Code that
+    times a stage only does so when it was handed an instance, so disabled timing costs
+    one ``is not None`` check per stage and frame.
+    """
+
+    STAGES = ("read", "convert", "inference", "draw", "composite", "write")
+
+    def __init__(self):
+        self._samples: Dict[str, List[float]] = {stage: [] for stage in self.STAGES}
+
+    def add(self, stage: str, started: float):
+        self._samples[stage].append(time.perf_counter() - started)
+
+    def samples_ms(self) -> Dict[str, np.ndarray]:
+        """The raw durations in ms of the stages that ran."""
+        return {stage: np.array(samples) * 1000 for stage, samples in self._samples.items() if samples}
+
+    def summary(self) -> dict:
+        """{stage: {count, p50_ms, p95_ms, max_ms, total_ms}} for the stages that ran."""
+        return _summarize_timings(self.samples_ms())
+
+
+def _summarize_timings(samples_ms: Dict[str, np.ndarray]) -> dict:
+    result = {}
+    for stage, ms in samples_ms.items():
+        p50, p95 = np.percentile(ms, [50, 95])
+        result[stage] = {
+            "count": len(ms),
+            "p50_ms": round(float(p50), 3),
+            "p95_ms": round(float(p95), 3),
+            "max_ms": round(float(ms.max()), 3),
+            "total_ms": round(float(ms.sum()), 1),
+        }
+    return result
+
+
+def _merge_timings(parts: List[Dict[str, np.ndarray]]) -> dict:
+    """Summarises every segment's raw samples together, so percentiles stay exact."""
+    return _summarize_timings({
+        stage: np.concatenate([part[stage] for part in parts if stage in part])
+        for stage in _StageTimings.STAGES
+        if any(stage in part for part in parts)
+    })
+
+
+def _decode_frames(
+    cap, frames: queue.Queue, stop: threading.Event, errors: list,
+    pool: _FramePool, max_frames: Optional[int] = None, timings: Optional[_StageTimings] = None,
+):
+    """Decoder stage: reads frames until EOF (or max_frames), then sends the None sentinel.
+
+    Frames are resized to the pool's frame size when it is smaller than the video's.
+    """
+    scratch = None  # full-size frame reused by downscaled jobs
+    try:
+        read = 0
+        while not stop.is_set() and (max_frames is None or read < max_frames):
+            read += 1
+            slot = pool.acquire(stop)
+            if slot is None:
+                return
+            if timings is not None:
+                started = time.perf_counter()
+            ret, frame = cap.read(slot.frame if scratch is None else scratch)
+            if not ret:
+                pool.release(slot)
+                break
+            if timings is not None:
+                timings.add("read", started)
+            if frame.shape != slot.frame.shape:
+                # Downscaled job: decode into one reused full-size frame, then resize into the slot
+                scratch = frame
+                h, w = slot.frame.shape[:2]
+                frame = cv2.resize(frame, (w, h), dst=slot.frame, interpolation=cv2.INTER_AREA)
+            if not np.may_share_memory(frame, slot.frame):
+                # OpenCV allocated its own frame instead of filling the view
+                np.copyto(slot.frame, frame)
+            if not _put_frame(frames, slot, stop):
+                return
+    except Exception as e:
+        errors.append(e)
+        stop.set()
+    _put_frame(frames, None, stop)
+
+
+def _encode_frames(
+    out, frames: queue.Queue, stop: threading.Event, errors: list, pool: _FramePool,
+    timings: Optional[_StageTimings] = None,
+):
+    """Encoder stage: writes frames until the None sentinel arrives (only recycles them without ``out``)."""
+    failed = False
+    while True:
+        slot = frames.get()
+        if slot is None:
+            return
+        if failed:
+            continue  # keep draining so the pose stage never blocks on a full queue
+        try:
+            if out is not None:
+                if timings is not None:
+                    started = time.perf_counter()
+                out.write(slot.canvas)
+                if timings is not None:
+                    timings.add("write", started)
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+            failed = True
+        pool.release(slot)
+
+
+def _interpolate_landmarks(
+    start: Optional[Landmarks], end: Optional[Landmarks], t: float
+) -> Optional[Landmarks]:
+    """Linear blend of two keyframes at 0 < t < 1; the nearer one if either is missing."""
+    if start is None or end is None:
+        return start if t < 0.5 else end
+    return start + (end - start) * np.float32(t)
+
+
+def _landmark_motion(start: Optional[Landmarks], end: Optional[Landmarks]) -> float:
+    """Mean displacement of landmarks visible in both keyframes (inf if the pose (dis)appeared)."""
+    if start is None or end is None:
+        return 0.0 if start is end else float("inf")
+    visible = (start[:, 3] > 0.5) & (end[:, 3] > 0.5)
+    if not visible.any():
+        return 0.0
+    return float(np.hypot(*(end[visible, :2] - start[visible, :2]).T).mean())
+
+
+def _landmark_track(track: List[Optional[Landmarks]]) -> np.ndarray:
+    """Stacks per-frame landmarks into a (frames, 33, 4) float32 array, NaN where no pose was found."""
+    array = np.full((len(track), 33, 4), np.nan, dtype=np.float32)
+    for i, keypoints in enumerate(track):
+        if keypoints is not None:
+            array[i] = keypoints
+    return array
+
+
 class DanceSkeletonProcessor:
     """Processes a dance video and creates side-by-side comparison (original | skeleton)."""
 
-    def __init__(self):
+    def __init__(self, inference_max_side: int = INFERENCE_MAX_SIDE):
         if not _HAS_MEDIAPIPE:
             raise RuntimeError("MediaPipe not installed in container.")
+        self.inference_max_side = inference_max_side
+        self._buffers: Dict[str, np.ndarray] = {}
+        self._timings: Optional[_StageTimings] = None  # set while process_video runs with timing on
         self._mp_pose = mp.solutions.pose
         self._mp_drawing = mp.solutions.drawing_utils
-        self._pose = self._mp_pose.Pose(
-            static_image_mode=False,
-            model_complexity=1,
-            enable_segmentation=False,
-            min_detection_confidence=0.5,
-            min_tracking_confidence=0.5
+        # model_complexity -> pose graph; the default is loaded now, others on first use
+        self._poses: Dict[int, object] = {}
+        self.set_model_complexity(MODEL_COMPLEXITY)
+        # ✅ Connection endpoints as index arrays, so drawing needs no Python loop
+        self._connections = np.array(sorted(self._mp_pose.POSE_CONNECTIONS), dtype=np.intp)
+
+    def set_model_complexity(self, model_complexity: int):
+        """Switches to the pose graph for ``model_complexity`` (0 = lite, 1 = full, 2 = heavy)."""
+        pose = self._poses.get(model_complexity)
+        if pose is None:
+            pose = self._poses[model_complexity] = self._mp_pose.Pose(
+                static_image_mode=False,
+                model_complexity=model_complexity,
+                enable_segmentation=False,
+                min_detection_confidence=0.5,
+                min_tracking_confidence=0.5
+            )
+        elif pose is not getattr(self, "_pose", None):
+            # A graph switched back to may still be tracking an earlier video
+            pose.reset()
+        self._pose = pose
+        self.model_complexity = model_complexity
+
+    def warm_up(self):
+        """Runs a blank frame through the pose graph so its start-up cost is paid now."""
+        self._pose.process(np.zeros((64, 64, 3), dtype=np.uint8))
+
+    def reset(self):
+        """Clears tracking state so the next video starts from a fresh detection."""
+        self._pose.reset()
+        self.warm_up()
+
+    def _scratch(self, name: str, shape: Tuple[int, ...]) -> np.ndarray:
+        """A reusable uint8 buffer, reallocated only when the requested shape changes."""
+        buffer = self._buffers.get(name)
+        if buffer is None or buffer.shape != shape:
+            buffer = self._buffers[name] = np.empty(shape, dtype=np.uint8)
+        return buffer
+
+    def _static_pose(self):
+        """A graph without tracking state for the current model, for frames detected out of order."""
+        key = ("static", self.model_complexity)
+        pose = self._poses.get(key)
+        if pose is None:
+            pose = self._poses[key] = self._mp_pose.Pose(
+                static_image_mode=True,
+                model_complexity=self.model_complexity,
+                enable_segmentation=False,
+                min_detection_confidence=0.5,
+            )
+        return pose
+
+    def _mediapipe_detector(self, frame: np.ndarray, static: bool = False) -> Optional[Landmarks]:
+        """Detect body keypoints using MediaPipe.
+
+        Frames larger than ``inference_max_side`` are downscaled first; landmarks are
+        normalised to [0, 1], so they still map onto the full-resolution frame. ``static``
+        runs the frame through a graph without tracking state, leaving the tracker untouched.
+        """
+        timings = self._timings
+        if timings is not None:
+            started = time.perf_counter()
+        h, w = frame.shape[:2]
+        if self.inference_max_side and max(h, w) > self.inference_max_side:
+            scale = self.inference_max_side / max(h, w)
+            # INTER_LINEAR: several times cheaper than INTER_AREA and the pose model does not care
+            size = (round(w * scale), round(h * scale))
+            frame = cv2.resize(
+                frame, size, dst=self._scratch("resized", (size[1], size[0], 3)),
+                interpolation=cv2.INTER_LINEAR,
+            )
+        rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=self._scratch("rgb", frame.shape))
+        if timings is not None:
+            timings.add("convert", started)
+            started = time.perf_counter()
+        results = (self._static_pose() if static else self._pose).process(rgb)
+        if timings is not None:
+            timings.add("inference", started)
+        if not results.pose_landmarks:
+            return None
+        return np.array(
+            [(lm.x, lm.y, lm.z, lm.visibility) for lm in results.pose_landmarks.landmark],
+            dtype=np.float32,
         )
 
-    def _mediapipe_detector(self, frame: np.ndarray) -> List:
-        """Detect body keypoints using MediaPipe."""
-        results = self._pose.process(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
-        return results.pose_landmarks.landmark if results.pose_landmarks else []
+    def draw_skeleton(
+        self, frame_shape, keypoints: Landmarks, out: Optional[np.ndarray] = None,
+        visibility_threshold: float = VISIBILITY_THRESHOLD, clear: bool = True,
+    ):
+        """Draws skeleton on black background (cleared in place when ``out`` is given).
 
-    def draw_skeleton(self, frame_shape, keypoints):
-        """Draws skeleton on black background."""
-        black_frame = np.zeros(frame_shape, dtype=np.uint8)
+        With ``clear=False`` the skeleton is drawn over the existing contents of ``out``.
+        """
+        if out is None:
+            black_frame = np.zeros(frame_shape, dtype=np.uint8)
+        else:
+            black_frame = out
+            if clear:
+                black_frame.fill(0)
         h, w, _ = frame_shape
-        for connection in self._mp_pose.POSE_CONNECTIONS:
-            start_idx, end_idx = connection
-            if keypoints[start_idx].visibility > 0.5 and keypoints[end_idx].visibility > 0.5:
-                start = (int(keypoints[start_idx].x * w), int(keypoints[start_idx].y * h))
-                end = (int(keypoints[end_idx].x * w), int(keypoints[end_idx].y * h))
-                cv2.line(black_frame, start, end, (0, 255, 0), 2)
-        for lm in keypoints:
-            if lm.visibility > 0.5:
-                cx, cy = int(lm.x * w), int(lm.y * h)
-                cv2.circle(black_frame, (cx, cy), 4, (0, 0, 255), -1)
+        points = (keypoints[:, :2] * np.array([w, h], dtype=np.float32)).astype(np.int32)
+        visible = keypoints[:, 3] > visibility_threshold
+
+        start_idx, end_idx = self._connections.T
+        drawn = visible[start_idx] & visible[end_idx]
+        segments = np.stack([points[start_idx[drawn]], points[end_idx[drawn]]], axis=1)
+        cv2.polylines(black_frame, segments, False, (0, 255, 0), 2)
+        # A one-point polyline of thickness 8 rasterises exactly like a filled circle of radius 4
+        cv2.polylines(black_frame, points[visible].reshape(-1, 1, 2), True, (0, 0, 255), 8)
         return black_frame
 
-    def process_video(self, input_path: str, output_path: str) -> dict:
-        """Processes the input video and saves side-by-side comparison."""
+    def process_video(
+        self,
+        input_path: str,
+        output_path: str,
+        progress: Optional[Callable[[int, int], None]] = None,
+        queue_depth: int = PIPELINE_QUEUE_DEPTH,
+        start_frame: int = 0,
+        end_frame: Optional[int] = None,
+        warmup_frames: int = 0,
+        pose_stride: int = POSE_STRIDE,
+        adaptive_stride: bool = ADAPTIVE_STRIDE,
+        motion_threshold: float = MOTION_THRESHOLD,
+        show_labels: bool = OVERLAY_LABELS,
+        show_frame_counter: bool = OVERLAY_FRAME_COUNTER,
+        show_timestamp: bool = OVERLAY_TIMESTAMP,
+        encoder: str = VIDEO_ENCODER,
+        preset: str = X264_PRESET,
+        crf: int = X264_CRF,
+        visibility_threshold: float = VISIBILITY_THRESHOLD,
+        landmarks_path: Optional[str] = None,
+        landmarks: Optional[np.ndarray] = None,
+        output_mode: OutputMode = OUTPUT_MODE,
+        stage_timings: bool = STAGE_TIMINGS,
+        frame_size: Optional[Tuple[int, int]] = None,
+    ) -> dict:
+        """Processes the input video and saves side-by-side comparison.
+
+        Decoding and encoding run in their own threads, connected to the pose stage in
+        this thread by queues holding at most ``queue_depth`` frames each.
+
+        Only frames ``[start_frame, end_frame)`` are written. Up to ``warmup_frames``
+        frames before ``start_frame`` are run through the pose model first so tracking
+        is already settled when the segment starts.
+
+        With ``pose_stride`` N > 1 MediaPipe only sees every Nth frame and landmarks for
+        the frames in between are interpolated. ``adaptive_stride`` re-detects those frames
+        instead, and drops to every frame until things calm down, whenever landmarks move
+        more than ``motion_threshold`` per frame between keyframes.
+
+        ``show_labels``, ``show_frame_counter`` and ``show_timestamp`` configure the
+        caption band at the top of the output.
+
+        ``encoder`` picks the writer backend (see ``create_video_writer``); ``preset``
+        and ``crf`` tune libx264 speed against size/quality.
+
+        The landmarks of every written frame are saved to ``landmarks_path`` (see
+        ``_landmark_track``) when given. Passing such an array as ``landmarks`` instead
+        re-renders the video from it without running the pose model.
+
+        ``output_mode`` is ``side_by_side`` (original | skeleton), ``overlay`` (skeleton
+        drawn on the original), ``skeleton_only``, or ``none``, which writes no video
+        at all and is only useful together with ``landmarks_path``.
+
+        ``stage_timings`` adds per-stage p50/p95/max durations to the info as ``timings``,
+        and the raw durations as ``timing_samples`` for merging segments.
+
+        ``frame_size`` (width, height) downscales every frame right after decoding, so all
+        buffers and the output are that size (see ``_memory_plan``).
+
+        ``progress`` is called as ``progress(frames_done, total_frames)`` at most every
+        ``PROGRESS_INTERVAL`` seconds and once more when the video is finished.
+        """
+        if output_mode not in OUTPUT_MODES:
+            raise ValueError(f"Unknown output mode: {output_mode!r} (expected one of {', '.join(OUTPUT_MODES)})")
         cap = cv2.VideoCapture(input_path)
         if not cap.isOpened():
             raise ValueError(f"Cannot open video: {input_path}")
@@ -91,51 +909,1456 @@ class DanceSkeletonProcessor:
         fps = cap.get(cv2.CAP_PROP_FPS) or 25
         width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
         height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        output_width = width * 2
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        if frame_size:
+            width, height = frame_size
+        output_width = width * 2 if output_mode == "side_by_side" else width
 
-        # ✅ Use mp4v instead of avc1 (more reliable in Docker)
-        fourcc = cv2.VideoWriter_fourcc(*"mp4v")
-        out = cv2.VideoWriter(str(output_path), fourcc, fps, (output_width, height))
+        seek_frame = max(0, start_frame - warmup_frames)
+        if seek_frame:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, seek_frame)
+        max_frames = None if end_frame is None else end_frame - seek_frame
+        span_end = total_frames if end_frame is None else min(end_frame, total_frames)
+        total_frames = max(0, span_end - start_frame)
+
+        out = None
+        if output_mode != "none":
+            try:
+                out = create_video_writer(
+                    str(output_path), fps, (output_width, height), encoder=encoder, preset=preset, crf=crf
+                )
+            except Exception:
+                cap.release()
+                raise
 
+        if progress:
+            progress(0, total_frames)
+
+        decoded: queue.Queue = queue.Queue(maxsize=queue_depth)
+        encoded: queue.Queue = queue.Queue(maxsize=queue_depth)
+        labels = {
+            "side_by_side": [("Original", 10), ("Skeleton", width + 10)],
+            "overlay": [("Overlay", 10)],
+            "skeleton_only": [("Skeleton", 10)],
+        }
+        overlay = _HeaderOverlay(
+            (height, output_width),
+            labels.get(output_mode, []) if show_labels else [],
+            fps, first_frame=start_frame,
+            frame_counter=show_frame_counter, timestamp=show_timestamp,
+        )
+
+        # Both queues full, frames waiting for the next keyframe, plus one in hand per stage
+        pool = _FramePool(height, width, 2 * queue_depth + max(1, pose_stride) + 2, layout=output_mode)
+        stop = threading.Event()
+        errors: list = []
+        timings = self._timings = _StageTimings() if stage_timings else None
+        decoder = threading.Thread(
+            target=_decode_frames, args=(cap, decoded, stop, errors, pool, max_frames, timings),
+            name="decoder", daemon=True,
+        )
+        encoder = threading.Thread(
+            target=_encode_frames, args=(out, encoded, stop, errors, pool, timings),
+            name="encoder", daemon=True,
+        )
+        decoder.start()
+        encoder.start()
+        track: Optional[List[Optional[Landmarks]]] = [] if landmarks_path else None
+        try:
+            if landmarks is not None:
+                frame_count, processed_frames, inferences = self._replay_stage(
+                    decoded, encoded, stop, overlay, total_frames, progress, landmarks[start_frame:],
+                    visibility_threshold=visibility_threshold, output_mode=output_mode,
+                )
+            else:
+                frame_count, processed_frames, inferences = self._pose_stage(
+                    decoded, encoded, stop, pool, overlay, total_frames, progress,
+                    warmup_frames=start_frame - seek_frame,
+                    pose_stride=max(1, pose_stride),
+                    motion_threshold=motion_threshold if adaptive_stride else float("inf"),
+                    visibility_threshold=visibility_threshold,
+                    output_mode=output_mode,
+                    track=track,
+                )
+        finally:
+            stop.set()
+            encoded.put(None)
+            encoder.join()
+            decoder.join()
+            cap.release()
+            self._timings = None
+            if out is not None:
+                out.release()
+        if errors:
+            raise errors[0]
+
+        if landmarks_path:
+            np.save(landmarks_path, _landmark_track(track))
+        if progress:
+            progress(frame_count, max(total_frames, frame_count))
+
+        info = {
+            "frames": frame_count,
+            "processed_frames": processed_frames,
+            "pose_inferences": inferences,
+            "encoder": out.name if out is not None else None,
+            "output_mode": output_mode,
+            "fps": fps,
+            "width": output_width,
+            "height": height,
+        }
+        if timings is not None:
+            info["timings"] = timings.summary()
+            info["timing_samples"] = timings.samples_ms()
+        return info
+
+    def _pose_stage(
+        self, decoded, encoded, stop, pool, overlay, total_frames, progress,
+        warmup_frames=0, pose_stride=1, motion_threshold=float("inf"),
+        visibility_threshold=VISIBILITY_THRESHOLD, output_mode=OUTPUT_MODE, track=None,
+    ) -> Tuple[int, int, int]:
+        """Pose stage: detects, draws and composites each decoded frame for the encoder.
+
+        Frames between keyframes wait in ``pending`` until the next keyframe is detected.
+        The landmarks of each emitted frame are appended to ``track`` if given.
+        """
         frame_count = 0
         processed_frames = 0
+        inferences = 0
+        last_report = time.monotonic()
+        pending: List[_FrameSlot] = []
+        previous: Optional[Landmarks] = None
+        stride = pose_stride
+        started = False
+
+        def detect(slot, static=False):
+            nonlocal inferences
+            inferences += 1
+            return self._mediapipe_detector(slot.frame, static)
+
+        def emit(slot, keypoints) -> bool:
+            nonlocal frame_count, processed_frames, last_report
+            if not self._compose_frame(
+                encoded, stop, slot, keypoints, overlay, frame_count, visibility_threshold, output_mode
+            ):
+                return False
+            if track is not None:
+                track.append(keypoints)
+            frame_count += 1
+            processed_frames += keypoints is not None
+            if progress and time.monotonic() - last_report >= PROGRESS_INTERVAL:
+                progress(frame_count, total_frames)
+                last_report = time.monotonic()
+            return True
+
+        def keyframe(slot) -> bool:
+            nonlocal previous, stride
+            keypoints = detect(slot)
+            gap = len(pending) + 1
+            motion = _landmark_motion(previous, keypoints) / gap if started else 0.0
+            if motion > motion_threshold:
+                # The tracker has already seen the later keyframe; feeding it these earlier frames
+                # would run its ROI tracking and smoothing backwards in time
+                between = [detect(f, static=True) for f in pending]
+                stride = 1
+            else:
+                between = [_interpolate_landmarks(previous, keypoints, i / gap) for i in range(1, gap)]
+                stride = pose_stride
+            for f, kp in zip(pending, between):
+                if not emit(f, kp):
+                    return False
+            pending.clear()
+            previous = keypoints
+            return emit(slot, keypoints)
 
         while True:
-            ret, frame = cap.read()
-            if not ret:
+            slot = _get_frame(decoded, stop)
+            if slot is None:
                 break
+            if warmup_frames:
+                warmup_frames -= 1
+                detect(slot)
+                pool.release(slot)
+                continue
+            if started and len(pending) + 1 < stride:
+                pending.append(slot)
+                continue
+            if not keyframe(slot):
+                return frame_count, processed_frames, inferences
+            started = True
 
-            keypoints = self._mediapipe_detector(frame)
-            skeleton_frame = (
-                self.draw_skeleton(frame.shape, keypoints)
-                if keypoints
-                else np.zeros_like(frame)
+        # EOF before the next keyframe: the last frame becomes one
+        if pending and not stop.is_set():
+            keyframe(pending.pop())
+        return frame_count, processed_frames, inferences
+
+    def _replay_stage(
+        self, decoded, encoded, stop, overlay, total_frames, progress, landmarks: np.ndarray,
+        visibility_threshold=VISIBILITY_THRESHOLD, output_mode=OUTPUT_MODE,
+    ) -> Tuple[int, int, int]:
+        """Stands in for the pose stage, taking each frame's landmarks from a saved track."""
+        frame_count = 0
+        processed_frames = 0
+        last_report = time.monotonic()
+        while True:
+            slot = _get_frame(decoded, stop)
+            if slot is None:
+                break
+            keypoints = landmarks[frame_count] if frame_count < len(landmarks) else None
+            if keypoints is not None and np.isnan(keypoints[0, 0]):
+                keypoints = None
+            if not self._compose_frame(
+                encoded, stop, slot, keypoints, overlay, frame_count, visibility_threshold, output_mode
+            ):
+                break
+            frame_count += 1
+            processed_frames += keypoints is not None
+            if progress and time.monotonic() - last_report >= PROGRESS_INTERVAL:
+                progress(frame_count, total_frames)
+                last_report = time.monotonic()
+        return frame_count, processed_frames, 0
+
+    def _compose_frame(
+        self, encoded, stop, slot: _FrameSlot, keypoints, overlay: _HeaderOverlay, frame_number: int,
+        visibility_threshold: float = VISIBILITY_THRESHOLD, output_mode: str = OUTPUT_MODE,
+    ) -> bool:
+        """Completes the output frame in place and hands it to the encoder."""
+        if output_mode == "none":
+            return _put_frame(encoded, slot, stop)
+        timings = self._timings
+        if timings is not None:
+            started = time.perf_counter()
+        if keypoints is not None:
+            self.draw_skeleton(
+                slot.skeleton.shape, keypoints, out=slot.skeleton,
+                visibility_threshold=visibility_threshold, clear=output_mode != "overlay",
             )
+        elif output_mode != "overlay":
+            slot.skeleton.fill(0)
+        if timings is not None:
+            timings.add("draw", started)
+            started = time.perf_counter()
 
-            combined_frame = np.hstack([frame, skeleton_frame])
-            cv2.putText(combined_frame, "Original", (10, 30),
-                        cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
-            cv2.putText(combined_frame, "Skeleton", (width + 10, 30),
-                        cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
+        overlay.apply(slot.canvas, frame_number)
+        if timings is not None:
+            timings.add("composite", started)
+        return _put_frame(encoded, slot, stop)
+
+    def close(self):
+        """Releases the pose graphs; closing them from ``__del__`` at interpreter exit can deadlock."""
+        poses, self._poses = getattr(self, "_poses", {}), {}
+        for pose in poses.values():
+            pose.close()
+
+    def __del__(self):
+        self.close()
+
+
+class ProcessorPool:
+    """Pre-initialised processors, checked out one per job and reset on return.
+
+    The reset (a graph restart plus warm-up inference, ~100 ms) runs on a background thread
+    after release, so it lands between jobs rather than on the tail of the one returning.
+    """
+
+    def __init__(self, size: int):
+        self._idle: "queue.Queue[DanceSkeletonProcessor]" = queue.Queue()
+        for _ in range(size):
+            processor = DanceSkeletonProcessor()
+            processor.warm_up()
+            self._idle.put(processor)
+
+    def acquire(self) -> "DanceSkeletonProcessor":
+        """Takes an idle processor, blocking until one is returned."""
+        return self._idle.get()
+
+    def release(self, processor: "DanceSkeletonProcessor"):
+        """Returns a processor to the pool once a background thread has reset it."""
+        threading.Thread(target=self._reset, args=(processor,), name="processor-reset", daemon=True).start()
+
+    def _reset(self, processor: "DanceSkeletonProcessor"):
+        try:
+            processor.reset()
+        except Exception:
+            # Never shrink the pool: replace a processor whose graph failed to restart
+            processor = DanceSkeletonProcessor()
+        self._idle.put(processor)
+
+    @contextmanager
+    def checkout(self):
+        processor = self.acquire()
+        try:
+            yield processor
+        finally:
+            self.release(processor)
+
+
+class _QualityLevel(NamedTuple):
+    inference_max_side: int
+    model_complexity: int
+    frame_stride: int  # run inference on every Nth frame, reusing the last landmarks in between
+
+
+class AdaptiveScheduler:
+    """Keeps a live session's per-frame inference time within a latency budget.
+
+    Inference time is averaged over a window of frames (skipped frames cost nothing). While the
+    average is over budget the session moves one step down a quality ladder: a smaller inference
+    resolution, then the lite pose model, then skipping frames. Once it falls below
+    ``RECOVER_RATIO`` of the budget it moves back up a step at a time.
+    """
+
+    WINDOW = 15
+    RECOVER_RATIO = 0.5
+    DEGRADED_SIDES = (480, 320)
+    MAX_FRAME_STRIDE = 4
+    # Cleared for every session once the lite model fails to load (MediaPipe downloads it on first use)
+    lite_model_available = True
+
+    def __init__(self, processor: DanceSkeletonProcessor, budget_ms: float = LIVE_LATENCY_BUDGET_MS):
+        self.processor = processor
+        self.budget_ms = budget_ms
+        self.levels = self._ladder(processor.inference_max_side, processor.model_complexity)
+        self.level = 0
+        self._costs: Deque[float] = deque(maxlen=self.WINDOW)
+        self._frames = 0
+        self._last: Optional[Landmarks] = None
+
+    @classmethod
+    def _ladder(cls, inference_max_side: int, model_complexity: int) -> List[_QualityLevel]:
+        levels = [_QualityLevel(inference_max_side, model_complexity, 1)]
+        for side in cls.DEGRADED_SIDES:
+            if not inference_max_side or side < inference_max_side:
+                levels.append(levels[-1]._replace(inference_max_side=side))
+        if model_complexity > 0 and cls.lite_model_available:
+            levels.append(levels[-1]._replace(model_complexity=0))
+        for stride in range(2, cls.MAX_FRAME_STRIDE + 1):
+            levels.append(levels[-1]._replace(frame_stride=stride))
+        return levels
+
+    def detect(self, frame: np.ndarray) -> Tuple[Optional[Landmarks], bool]:
+        """Landmarks for ``frame`` and whether it was skipped (then they are the previous frame's)."""
+        self._frames += 1
+        if self._frames % self.levels[self.level].frame_stride:
+            self._record(0.0)
+            return self._last, True
+        started = time.perf_counter()
+        self._last = self.processor._mediapipe_detector(frame)
+        self._record((time.perf_counter() - started) * 1000)
+        return self._last, False
+
+    def _record(self, cost_ms: float):
+        if self.budget_ms <= 0:
+            return
+        self._costs.append(cost_ms)
+        if len(self._costs) < self.WINDOW:
+            return
+        average = sum(self._costs) / len(self._costs)
+        if average > self.budget_ms and self.level < len(self.levels) - 1:
+            self._set_level(self.level + 1)
+        elif average < self.budget_ms * self.RECOVER_RATIO and self.level > 0:
+            self._set_level(self.level - 1)
+
+    def _set_level(self, level: int):
+        settings = self.levels[level]
+        self.processor.inference_max_side = settings.inference_max_side
+        if settings.model_complexity != self.processor.model_complexity:
+            try:
+                self.processor.set_model_complexity(settings.model_complexity)
+            except Exception:
+                logger.warning("Lite pose model unavailable, live sessions will not switch to it", exc_info=True)
+                AdaptiveScheduler.lite_model_available = False
+                # Without that step the same index is the next degradation on the ladder
+                self.levels = self._ladder(*self.levels[0][:2])
+                return self._set_level(level)
+        if level != self.level:
+            logger.info("Live quality level %d -> %d: %s", self.level, level, settings)
+        self.level = level
+        # Judge the new level on its own frames only
+        self._costs.clear()
+
+    def report(self) -> dict:
+        """The current quality level and the degradations it applies."""
+        base, current = self.levels[0], self.levels[self.level]
+        degradations = []
+        if current.inference_max_side != base.inference_max_side:
+            degradations.append("inference_resolution")
+        if current.model_complexity != base.model_complexity:
+            degradations.append("model_complexity")
+        if current.frame_stride > 1:
+            degradations.append("frame_skip")
+        return {"level": self.level, **current._asdict(), "degradations": degradations}
+
+    def close(self):
+        """Restores the processor's full-quality settings."""
+        self._set_level(0)
+
+
+# One pool per worker process (process mode) or shared by all worker threads (thread mode)
+_processor_pool: Optional[ProcessorPool] = None
+_processor_pool_lock = threading.Lock()
 
-            out.write(combined_frame)
-            frame_count += 1
-            processed_frames += bool(keypoints)
 
+def _init_processor_pool(size: int):
+    """Builds this process's processor pool; callers racing the first build wait for it."""
+    global _processor_pool
+    with _processor_pool_lock:
+        if _processor_pool is not None:
+            return
+        started = time.perf_counter()
+        _processor_pool = ProcessorPool(size)
+        _startup_timings["processor_pool_s"] = round(time.perf_counter() - started, 3)
+
+
+def _get_processor_pool() -> ProcessorPool:
+    """The pool, built on first use if start-up warm-up has not got to it yet."""
+    if _processor_pool is None:
+        # Thread mode shares one pool between all worker threads, so it needs a processor each
+        _init_processor_pool(PROCESS_WORKERS if EXECUTION_MODE == "thread" else 1)
+    return _processor_pool
+
+
+def _probe_worker(barrier=None) -> dict:
+    """Runs a dummy inference on a pooled processor and reports this worker's start-up costs.
+
+    With a ``barrier`` the worker is held until every worker has picked up a probe, so one
+    fast worker cannot answer them all.
+    """
+    with _get_processor_pool().checkout() as processor:
+        started = time.perf_counter()
+        processor.warm_up()
+        inference_ms = round((time.perf_counter() - started) * 1000, 2)
+    if barrier is not None:
+        try:
+            barrier.wait(10)
+        except threading.BrokenBarrierError:
+            pass  # another worker is busy or still loading; the caller probes again
+    return {"pid": os.getpid(), **_startup_timings, "probe_inference_ms": inference_ms}
+
+
+async def _warm_up_workers(app: FastAPI):
+    """Loads the MediaPipe models and probes every worker, then marks the app ready."""
+    loop = asyncio.get_running_loop()
+    readiness = app.state.readiness
+    started = time.perf_counter()
+    try:
+        executor = app.state.executor
+        workers: Dict[int, dict] = {}
+        if EXECUTION_MODE == "process":
+            # Each submission spawns a worker whose initializer builds its processor pool. Probes
+            # wait at a barrier so each lands on a different worker; rounds repeat until every
+            # worker has answered (one may be busy with an early job or still loading)
+            while len(workers) < PROCESS_WORKERS:
+                barrier = app.state.manager.Barrier(PROCESS_WORKERS)
+                probes = await asyncio.gather(*(
+                    loop.run_in_executor(executor, _probe_worker, barrier) for _ in range(PROCESS_WORKERS)
+                ))
+                workers.update((probe["pid"], probe) for probe in probes)
+        else:
+            await loop.run_in_executor(None, _init_processor_pool, PROCESS_WORKERS)
+            probe = await loop.run_in_executor(executor, _probe_worker)
+            workers[probe["pid"]] = probe
+    except Exception as exc:
+        readiness["error"] = f"{type(exc).__name__}: {exc}"
+        logger.exception("Worker warm-up failed")
+        return
+    readiness.update(
+        ready=True,
+        error=None,
+        warm_up_s=round(time.perf_counter() - started, 3),
+        workers=list(workers.values()),
+    )
+    logger.info("Workers ready in %.2fs: %s", readiness["warm_up_s"], readiness["workers"])
+
+
+def _status_mb(field: str) -> Optional[float]:
+    """A memory figure of this process from /proc/self/status in MB, None without procfs."""
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith(f"{field}:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def _reset_peak_rss():
+    """Restarts this process's peak RSS (VmHWM) from its current RSS, where Linux allows it."""
+    try:
+        with open("/proc/self/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+    except OSError:
+        pass
+
+
+def _process_job(
+    progress_key: Hashable,
+    input_path: str,
+    output_path: str,
+    progress_store: MutableMapping,
+    start_frame: int = 0,
+    end_frame: Optional[int] = None,
+    warmup_frames: int = 0,
+    **options,
+) -> dict:
+    """Runs inside a pool worker: processes one video (or segment) and returns its info.
+
+    Extra ``options`` are passed on to ``DanceSkeletonProcessor.process_video``. The info
+    gains the worker's RSS before the job and its peak while running it; in thread mode
+    both are shared by every job running at the time.
+    """
+    started = time.time()
+
+    def report(done: int, total: int):
+        progress_store[progress_key] = (done, total, started)
+
+    with _get_processor_pool().checkout() as processor:
+        baseline_rss_mb = _status_mb("VmRSS")
+        _reset_peak_rss()
+        info = processor.process_video(
+            input_path, output_path, progress=report,
+            start_frame=start_frame, end_frame=end_frame, warmup_frames=warmup_frames, **options,
+        )
+        info["memory"] = {"baseline_rss_mb": baseline_rss_mb, "peak_rss_mb": _status_mb("VmHWM")}
+    return info
+
+
+def _rerender_job(
+    progress_key: Hashable,
+    input_path: str,
+    output_path: str,
+    progress_store: MutableMapping,
+    landmarks_path: str,
+    options: dict,
+) -> dict:
+    """Runs inside a pool worker: redraws a video from its saved landmarks, skipping the pose model."""
+    landmarks = np.load(landmarks_path)
+    return _process_job(progress_key, input_path, output_path, progress_store, landmarks=landmarks, **options)
+
+
+def _concat_landmarks(part_paths: List[str], output_path: str):
+    np.save(output_path, np.concatenate([np.load(p) for p in part_paths]))
+
+
+def _plan_segments(input_path: str) -> Tuple[List[Tuple[int, Optional[int]]], int]:
+    """Splits a video into SEGMENT_SECONDS-long frame ranges; the last one runs to EOF."""
+    cap = cv2.VideoCapture(input_path)
+    try:
+        fps = cap.get(cv2.CAP_PROP_FPS) or 25
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    finally:
         cap.release()
-        out.release()
 
-        return {
-            "frames": frame_count,
-            "processed_frames": processed_frames,
+    segment_length = max(1, round(SEGMENT_SECONDS * fps))
+    if SEGMENT_SECONDS <= 0 or total_frames <= segment_length:
+        return [(0, None)], total_frames
+    starts = list(range(0, total_frames, segment_length))
+    ends: List[Optional[int]] = starts[1:] + [None]
+    return list(zip(starts, ends)), total_frames
+
+
+def _memory_plan(
+    input_path: str, output_mode: str, encoder: str = VIDEO_ENCODER,
+) -> Tuple[Optional[Tuple[int, int]], float]:
+    """Picks the frame size a job fits JOB_MEMORY_BUDGET_MB at, or rejects it with 413.
+
+    Returns ``(frame_size, estimate_mb)``; ``frame_size`` is None when the source size fits.
+    Downscaling keeps the aspect ratio and even dimensions (for yuv420p) and never takes
+    the short side below ``MIN_DOWNSCALED_SIDE``.
+    """
+    cap = cv2.VideoCapture(input_path)
+    try:
+        source = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    finally:
+        cap.release()
+
+    size, scale = source, 1.0
+    while True:
+        estimate_mb = sum(estimate_job_memory(source, size, frames, output_mode, encoder).values()) / 2**20
+        if JOB_MEMORY_BUDGET_MB <= 0 or estimate_mb <= JOB_MEMORY_BUDGET_MB:
+            return (None if size == source else size), round(estimate_mb, 1)
+        scale *= 0.9
+        smaller = tuple(round(side * scale / 2) * 2 for side in source)
+        if MEMORY_POLICY != "downscale" or min(smaller) < MIN_DOWNSCALED_SIDE:
+            break
+        size = smaller
+    raise HTTPException(
+        status_code=413,
+        detail=f"Video needs an estimated {estimate_mb:.0f} MB to process, "
+               f"over the {JOB_MEMORY_BUDGET_MB:g} MB per-job memory budget",
+    )
+
+
+def _concat_segments(segment_paths: List[str], output_path: str):
+    """Stitches encoded segments, in order, into a single video."""
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg:
+        # Stream copy: no re-encode, segments share codec settings
+        list_path = Path(output_path).with_suffix(".txt")
+        list_path.write_text("".join(f"file '{Path(p).resolve()}'\n" for p in segment_paths))
+        try:
+            result = subprocess.run(
+                [ffmpeg, "-y", "-loglevel", "error", "-f", "concat", "-safe", "0",
+                 "-i", str(list_path), "-c", "copy", "-movflags", "+faststart", output_path],
+                capture_output=True, text=True,
+            )
+        finally:
+            list_path.unlink(missing_ok=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"ffmpeg concat failed: {result.stderr.strip()}")
+        return
+
+    # ✅ No ffmpeg: re-write the segments frame by frame with OpenCV
+    out = None
+    try:
+        for path in segment_paths:
+            cap = cv2.VideoCapture(path)
+            if out is None:
+                size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+                out = OpenCVVideoWriter(output_path, cap.get(cv2.CAP_PROP_FPS) or 25, size)
+            while True:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                out.write(frame)
+            cap.release()
+    finally:
+        if out is not None:
+            out.release()
+
+
+@dataclass
+class Job:
+    """A submitted video and the state of its processing."""
+    id: str
+    input_path: Path
+    output_path: Path
+    state: str = "queued"  # queued -> running -> completed | failed
+    progress: Tuple[int, int] = (0, 0)
+    started_at: Optional[float] = None  # when a worker picked the job up
+    segments: int = 0
+    info: Optional[dict] = None
+    error: Optional[str] = None
+    upload_hash: Optional[str] = None
+    cached: bool = False
+    landmarks_path: Optional[Path] = None
+    source_path: Optional[Path] = None
+    render_options: Optional[dict] = None  # set for re-renders from saved landmarks
+    client: Optional[str] = None  # who holds the job's admission place
+    frame_size: Optional[Tuple[int, int]] = None  # set when downscaled to fit the memory budget
+    memory_estimate_mb: Optional[float] = None
+    output_mode: str = OUTPUT_MODE
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+
+
+class RenderOptions(BaseModel):
+    """Drawing settings that can change when re-rendering from saved landmarks."""
+    visibility_threshold: float = VISIBILITY_THRESHOLD
+    show_labels: bool = OVERLAY_LABELS
+    show_frame_counter: bool = OVERLAY_FRAME_COUNTER
+    show_timestamp: bool = OVERLAY_TIMESTAMP
+    encoder: str = VIDEO_ENCODER
+    preset: str = X264_PRESET
+    crf: int = X264_CRF
+    output_mode: OutputMode = OUTPUT_MODE
+
+
+class _Histogram:
+    """A cumulative Prometheus histogram."""
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _sample(value: float) -> str:
+    """A metric value in full precision (``%g`` would turn byte counts into 2.00542e+06)."""
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class _Metrics:
+    """Job and throughput metrics, kept in the API process and rendered for ``/metrics``."""
+
+    COUNTERS = {
+        "dance_jobs_submitted_total": "Jobs submitted (uploads and re-renders).",
+        "dance_jobs_completed_total": "Jobs completed, including cache hits.",
+        "dance_jobs_failed_total": "Jobs that failed.",
+        "dance_jobs_cached_total": "Jobs answered from the result cache without processing.",
+        "dance_frames_processed_total": "Video frames run through the pipeline.",
+        "dance_frames_with_pose_total": "Processed frames in which a pose was found.",
+        "dance_output_bytes_total": "Bytes of video and landmark files written.",
+        "dance_jobs_rejected_total": "Jobs turned away by admission control (429 or 503).",
+    }
+    HISTOGRAMS = {
+        "dance_job_duration_seconds": (
+            "Processing time of jobs, from a worker picking them up to finishing.",
+            (1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800),
+        ),
+        "dance_job_turnaround_seconds": (
+            "Submit-to-finish time of processed jobs, waiting for a slot included.",
+            (1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800),
+        ),
+        "dance_job_frames_per_second": (
+            "Frames processed per second of processing time.", (1, 2, 5, 10, 15, 20, 30, 60, 120),
+        ),
+        "dance_job_peak_rss_megabytes": (
+            "Peak worker RSS while processing a job.", (256, 384, 512, 768, 1024, 1536, 2048, 3072, 4096),
+        ),
+    }
+
+    def __init__(self):
+        self.counters: Dict[str, float] = dict.fromkeys(self.COUNTERS, 0)
+        self.histograms = {name: _Histogram(buckets) for name, (_, buckets) in self.HISTOGRAMS.items()}
+
+    def observe_job(self, job: Job):
+        """Records a finished job's outcome and, if it was processed, its throughput."""
+        if job.state != "completed":
+            self.counters["dance_jobs_failed_total"] += 1
+            return
+        self.counters["dance_jobs_completed_total"] += 1
+        if job.cached:
+            self.counters["dance_jobs_cached_total"] += 1
+            return
+        frames = job.info["frames"]
+        self.counters["dance_frames_processed_total"] += frames
+        self.counters["dance_frames_with_pose_total"] += job.info["processed_frames"]
+        # Re-renders reuse the landmarks of the job they were made from
+        written = [job.output_path] if job.render_options is not None else [job.output_path, job.landmarks_path]
+        self.counters["dance_output_bytes_total"] += sum(
+            path.stat().st_size for path in written if path is not None and path.exists()
+        )
+        self.histograms["dance_job_turnaround_seconds"].observe(job.finished_at - job.created_at)
+        if job.started_at is not None:
+            duration = job.finished_at - job.started_at
+            self.histograms["dance_job_duration_seconds"].observe(duration)
+            if duration > 0:
+                self.histograms["dance_job_frames_per_second"].observe(frames / duration)
+        peak_rss_mb = job.info.get("memory", {}).get("peak_rss_mb")
+        if peak_rss_mb is not None:
+            self.histograms["dance_job_peak_rss_megabytes"].observe(peak_rss_mb)
+
+    def render(self, gauges: Dict[str, Tuple[str, float]]) -> str:
+        """Prometheus text exposition format (0.0.4)."""
+        lines = []
+        for name, value in self.counters.items():
+            lines += [f"# HELP {name} {self.COUNTERS[name]}", f"# TYPE {name} counter", f"{name} {_sample(value)}"]
+        for name, histogram in self.histograms.items():
+            lines += [f"# HELP {name} {self.HISTOGRAMS[name][0]}", f"# TYPE {name} histogram"]
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                lines.append(f'{name}_bucket{{le="{bound:g}"}} {count}')
+            lines += [
+                f'{name}_bucket{{le="+Inf"}} {histogram.count}',
+                f"{name}_sum {_sample(histogram.sum)}",
+                f"{name}_count {histogram.count}",
+            ]
+        for name, (help_text, value) in gauges.items():
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {_sample(value)}"]
+        return "\n".join(lines) + "\n"
+
+
+class AdmissionController:
+    """Bounds how many jobs run and wait, serving waiting clients round-robin.
+
+    A job's place is reserved with ``admit`` as soon as its request arrives, held while it waits
+    for and occupies a running ``slot``, and given back with ``release`` when it finishes. Waiting
+    jobs are queued per client and the queues take turns, so a client with many uploads cannot
+    starve the others.
+    """
+
+    def __init__(self, max_running: int, max_queued: int, max_per_client: int):
+        self.max_running = max_running
+        self.max_queued = max_queued
+        self.max_per_client = max_per_client
+        self.running = 0
+        self.admitted = 0
+        self._clients: Dict[str, int] = {}
+        # client -> its waiting jobs; dict order is the round-robin order
+        self._waiting: Dict[str, Deque[asyncio.Future]] = {}
+        self._average_s = 30.0  # smoothed slot hold time, for Retry-After
+
+    @property
+    def waiting(self) -> int:
+        return self.admitted - self.running
+
+    def admit(self, client: str):
+        """Reserves a place for one of ``client``'s jobs; raises 429 or 503 with Retry-After if full."""
+        if self._clients.get(client, 0) >= self.max_per_client:
+            raise self._reject(429, f"Too many jobs in progress for this client (limit {self.max_per_client})")
+        if self.admitted >= self.max_running + self.max_queued:
+            raise self._reject(503, "Server is at capacity")
+        self._clients[client] = self._clients.get(client, 0) + 1
+        self.admitted += 1
+
+    def release(self, client: str):
+        self.admitted -= 1
+        self._clients[client] -= 1
+        if not self._clients[client]:
+            del self._clients[client]
+
+    def _reject(self, status_code: int, detail: str) -> HTTPException:
+        _metrics.counters["dance_jobs_rejected_total"] += 1
+        # Roughly when a place frees up: the jobs ahead, run MAX_RUNNING_JOBS at a time
+        waves = self.waiting / self.max_running + 1
+        retry_after = min(3600, max(1, math.ceil(self._average_s * waves)))
+        return HTTPException(status_code=status_code, detail=detail, headers={"Retry-After": str(retry_after)})
+
+    @asynccontextmanager
+    async def slot(self, client: str):
+        """Waits for a running slot, taking turns with other clients' waiting jobs, and holds it."""
+        if self.running < self.max_running and not self._waiting:
+            self.running += 1
+        else:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiting.setdefault(client, deque()).append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    self._free_slot()  # granted just as we were cancelled
+                else:
+                    # _free_slot may already have popped (and skipped) the cancelled waiter
+                    waiters = self._waiting.get(client)
+                    if waiters is not None and waiter in waiters:
+                        waiters.remove(waiter)
+                        if not waiters:
+                            del self._waiting[client]
+                raise
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._average_s += 0.2 * (time.monotonic() - started - self._average_s)
+            self._free_slot()
+
+    def _free_slot(self):
+        self.running -= 1
+        while self.running < self.max_running and self._waiting:
+            client = next(iter(self._waiting))
+            waiters = self._waiting.pop(client)
+            waiter = waiters.popleft()
+            if waiters:
+                self._waiting[client] = waiters  # back of the line
+            if waiter.done():
+                continue  # cancelled while waiting; its task no longer wants the slot
+            self.running += 1
+            waiter.set_result(None)
+
+
+def _client_id(request: Request) -> str:
+    """Who a request counts against: ``CLIENT_ID_HEADER`` if set, else the peer address.
+
+    For list headers like X-Forwarded-For the rightmost entry is used: it is the one the
+    trusted proxy appended, while anything to its left is whatever the client sent.
+    """
+    if CLIENT_ID_HEADER:
+        value = request.headers.get(CLIENT_ID_HEADER)
+        if value:
+            return value.rsplit(",", 1)[-1].strip()
+    return request.client.host if request.client else "unknown"
+
+
+def _claim_admission(request: Request, job: Job):
+    """Hands the place reserved by ``admission_control`` to ``job``, which releases it when done."""
+    job.client = request.state.admission
+    request.state.admission = None
+
+
+_metrics = _Metrics()
+_admission = AdmissionController(MAX_RUNNING_JOBS, MAX_QUEUED_JOBS, MAX_JOBS_PER_CLIENT)
+_jobs: Dict[str, Job] = {}
+_job_tasks: Set[asyncio.Task] = set()
+# Cache key -> future resolving to the job that is currently producing that result
+_inflight: Dict[str, asyncio.Future] = {}
+
+
+def _prune_jobs():
+    """Forgets finished jobs older than JOB_TTL_SECONDS (their output files stay on disk).
+
+    Kept sources go with them: a source no remaining job refers to and that has not been
+    used (stored, or reused by a cache hit) for JOB_TTL_SECONDS is deleted.
+    """
+    cutoff = time.time() - JOB_TTL_SECONDS
+    for job_id in [j.id for j in _jobs.values() if j.finished_at and j.finished_at < cutoff]:
+        del _jobs[job_id]
+    in_use = {job.source_path for job in _jobs.values()}
+    for path in SOURCE_DIR.iterdir():
+        try:
+            if path not in in_use and path.stat().st_mtime < cutoff:
+                path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def _get_job(job_id: str) -> Job:
+    job = _jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    return job
+
+
+def _output_path(video_id: str, output_mode: str) -> Path:
+    """e.g. processed/abc123_sidebyside.mp4 or processed/abc123_overlay.mp4."""
+    return PROCESSED_DIR / f"{video_id}_{output_mode.replace('_', '')}.mp4"
+
+
+def _upload_too_large() -> HTTPException:
+    return HTTPException(
+        status_code=413, detail=f"File exceeds the {MAX_UPLOAD_BYTES // (1024 * 1024)} MB upload limit"
+    )
+
+
+def _write_chunk(buffer, digest, chunk: bytes):
+    digest.update(chunk)
+    buffer.write(chunk)
+
+
+async def _save_upload(file: UploadFile, output_mode: str = OUTPUT_MODE) -> Job:
+    """Validates and stores an upload, registering a queued job for it.
+
+    The spooled upload is read and written in ``UPLOAD_CHUNK_SIZE`` pieces with the file
+    I/O running in the default thread pool, so large uploads never block the event loop.
+    The content is hashed on the way through for the result cache, and the stored video is
+    checked against the per-job memory budget.
+    """
+    if not file.content_type.startswith("video/"):
+        raise HTTPException(status_code=400, detail="File must be a video")
+    if file.size is not None and file.size > MAX_UPLOAD_BYTES:
+        raise _upload_too_large()
+
+    video_id = str(uuid.uuid4())[:8]
+    job = Job(
+        id=video_id,
+        input_path=UPLOAD_DIR / f"{video_id}_temp{Path(file.filename).suffix}",
+        output_path=_output_path(video_id, output_mode),
+        landmarks_path=PROCESSED_DIR / f"{video_id}_landmarks.npy",
+        output_mode=output_mode,
+    )
+    loop = asyncio.get_running_loop()
+    digest = hashlib.sha256()
+    written = 0
+    try:
+        with job.input_path.open("wb") as buffer:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                written += len(chunk)
+                if written > MAX_UPLOAD_BYTES:
+                    raise _upload_too_large()
+                await loop.run_in_executor(None, _write_chunk, buffer, digest, chunk)
+        job.frame_size, job.memory_estimate_mb = await loop.run_in_executor(
+            None, _memory_plan, str(job.input_path), output_mode
+        )
+    except BaseException:
+        job.input_path.unlink(missing_ok=True)
+        raise
+    job.upload_hash = digest.hexdigest()
+    _prune_jobs()
+    _jobs[job.id] = job
+    return job
+
+
+def _processing_options(job: Job) -> dict:
+    """Every setting that changes the rendered output, for the result cache key."""
+    encoder = _resolve_encoder(VIDEO_ENCODER)
+    return {
+        "model_complexity": MODEL_COMPLEXITY,
+        "inference_max_side": INFERENCE_MAX_SIDE,
+        "pose_stride": POSE_STRIDE,
+        "adaptive_stride": ADAPTIVE_STRIDE,
+        "motion_threshold": MOTION_THRESHOLD,
+        "visibility_threshold": VISIBILITY_THRESHOLD,
+        "output_mode": job.output_mode,
+        "frame_size": job.frame_size,
+        "segment_seconds": SEGMENT_SECONDS,
+        "segment_warmup_frames": SEGMENT_WARMUP_FRAMES,
+        "overlay": [OVERLAY_LABELS, OVERLAY_FRAME_COUNTER, OVERLAY_TIMESTAMP],
+        "encoder": encoder,
+        "x264": [X264_PRESET, X264_CRF] if encoder == "ffmpeg" else None,
+    }
+
+
+def _cache_key(job: Job) -> Optional[str]:
+    if not RESULT_CACHE or job.upload_hash is None:
+        return None
+    options = json.dumps(_processing_options(job), sort_keys=True)
+    return hashlib.sha256(f"{job.upload_hash}:{options}".encode()).hexdigest()
+
+
+def _job_outputs(job: Job) -> dict:
+    """The Job fields a finished job hands on to cache hits and deduplicated followers."""
+    return {
+        "output_path": job.output_path,
+        "info": job.info,
+        "landmarks_path": job.landmarks_path,
+        "source_path": job.source_path,
+    }
+
+
+def _cache_lookup(key: str) -> Optional[dict]:
+    """Returns the cached job outputs for a key, if its video still exists."""
+    try:
+        entry = json.loads((CACHE_DIR / f"{key}.json").read_text())
+    except (OSError, ValueError):
+        return None
+    output_path = PROCESSED_DIR / entry["output"] if entry["output"] else None
+    landmarks_path = PROCESSED_DIR / entry["landmarks"] if entry.get("landmarks") else None
+    source_path = SOURCE_DIR / entry["source"] if entry.get("source") else None
+    # Jobs with output mode "none" have nothing but their landmarks to reuse
+    result_path = output_path or landmarks_path
+    if result_path is None or not result_path.exists():
+        return None
+    if source_path is not None:
+        try:
+            os.utime(source_path)  # a reused source stays kept for another JOB_TTL_SECONDS
+        except FileNotFoundError:
+            source_path = None
+    hit = {
+        "info": entry["info"],
+        "landmarks_path": landmarks_path if landmarks_path and landmarks_path.exists() else None,
+        "source_path": source_path,
+    }
+    if output_path is not None:
+        hit["output_path"] = output_path
+    return hit
+
+
+def _cache_store(key: str, job: Job):
+    entry = {
+        "output": job.output_path.name if job.output_mode != "none" else None,
+        "info": job.info,
+        "landmarks": job.landmarks_path.name if job.landmarks_path else None,
+        "source": job.source_path.name if job.source_path else None,
+        "created_at": time.time(),
+    }
+    tmp = CACHE_DIR / f"{key}.json.tmp"
+    tmp.write_text(json.dumps(entry))
+    os.replace(tmp, CACHE_DIR / f"{key}.json")
+
+
+def _progress_keys(job: Job) -> List[Hashable]:
+    return [(job.id, i) for i in range(job.segments)] if job.segments else [job.id]
+
+
+def _read_progress(app: FastAPI, job: Job) -> Optional[Tuple[int, int, float]]:
+    """Sums the progress reported by the job's worker(s) as (done, total, started); None until one has started."""
+    reports = [app.state.progress.get(key) for key in _progress_keys(job)]
+    reports = [r for r in reports if r]
+    if not reports:
+        return None
+    done = sum(r[0] for r in reports)
+    total = job.progress[1] if job.segments else reports[0][1]
+    return done, max(total, done), min(r[2] for r in reports)
+
+
+def _sync_progress(app: FastAPI, job: Job) -> bool:
+    """Copies the workers' latest progress onto the job; False if none has reported yet."""
+    reported = _read_progress(app, job)
+    if not reported:
+        return False
+    done, total, job.started_at = reported
+    job.progress = (done, total)
+    return True
+
+
+async def _run_segments(app: FastAPI, job: Job, segments: List[Tuple[int, Optional[int]]]) -> dict:
+    """Processes each segment in its own worker, then stitches them in order."""
+    loop = asyncio.get_running_loop()
+    parts = [job.output_path.with_name(f"{job.output_path.stem}.part{i}.mp4") for i in range(len(segments))]
+    tracks = [part.with_suffix(".npy") for part in parts]
+    try:
+        results = await asyncio.gather(*(
+            loop.run_in_executor(
+                app.state.executor, partial(
+                    _process_job, (job.id, i), str(job.input_path), str(part), app.state.progress,
+                    start, end, SEGMENT_WARMUP_FRAMES,
+                    landmarks_path=str(track), output_mode=job.output_mode, frame_size=job.frame_size,
+                ),
+            )
+            for i, ((start, end), part, track) in enumerate(zip(segments, parts, tracks))
+        ), return_exceptions=True)
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        if job.output_mode != "none":
+            await loop.run_in_executor(
+                app.state.executor, _concat_segments, [str(p) for p in parts], str(job.output_path)
+            )
+        await loop.run_in_executor(
+            None, _concat_landmarks, [str(t) for t in tracks], str(job.landmarks_path)
+        )
+    finally:
+        for part in parts + tracks:
+            part.unlink(missing_ok=True)
+
+    info = {
+        **results[0],
+        "frames": sum(r["frames"] for r in results),
+        "processed_frames": sum(r["processed_frames"] for r in results),
+        "pose_inferences": sum(r["pose_inferences"] for r in results),
+        "segments": len(segments),
+    }
+    if "timings" in info:
+        info["timings"] = _merge_timings([r["timing_samples"] for r in results])
+    info["memory"] = {
+        name: max((r["memory"][name] for r in results if r["memory"][name] is not None), default=None)
+        for name in info["memory"]
+    }
+    return info
+
+
+async def _run_job(app: FastAPI, job: Job):
+    """Processes a job in the worker pool and records its outcome.
+
+    Results are cached by upload hash and processing options: a repeat upload reuses the
+    stored output, and one arriving while the same work is running waits for it.
+    """
+    _metrics.counters["dance_jobs_submitted_total"] += 1
+    try:
+        key = _cache_key(job)
+        if key is None:
+            return await _execute_job(app, job)
+        if await _reuse_result(job, key):
+            return
+
+        _inflight[key] = asyncio.get_running_loop().create_future()
+        try:
+            await _execute_job(app, job)
+            if job.state == "completed":
+                _cache_store(key, job)
+        finally:
+            _inflight.pop(key).set_result(job)
+    finally:
+        _admission.release(job.client)
+
+
+async def _reuse_result(job: Job, key: str) -> bool:
+    """Completes a job from the cache or an identical in-flight job; False if neither applies."""
+    hit = _cache_lookup(key)
+    if hit is not None:
+        job.state = "completed"
+    elif key in _inflight:
+        leader = await asyncio.shield(_inflight[key])
+        job.state, job.error = leader.state, leader.error
+        hit = _job_outputs(leader)
+    else:
+        return False
+    for name, value in hit.items():
+        setattr(job, name, value)
+    job.cached = job.state == "completed"
+    job.input_path.unlink(missing_ok=True)
+    job.finished_at = time.time()
+    _metrics.observe_job(job)
+    return True
+
+
+async def _process_upload(app: FastAPI, job: Job):
+    """Runs the pose pipeline on a job's upload, split into segments when it is long enough."""
+    loop = asyncio.get_running_loop()
+    segments, total_frames = await loop.run_in_executor(None, _plan_segments, str(job.input_path))
+    if len(segments) > 1:
+        job.segments = len(segments)
+        job.progress = (0, total_frames)
+        job.info = await _run_segments(app, job, segments)
+    else:
+        job.info = await loop.run_in_executor(
+            app.state.executor, partial(
+                _process_job, job.id, str(job.input_path), str(job.output_path), app.state.progress,
+                landmarks_path=str(job.landmarks_path), output_mode=job.output_mode,
+                frame_size=job.frame_size,
+            ),
+        )
+
+
+async def _execute_job(app: FastAPI, job: Job):
+    """Processes the job once admission control gives it a running slot."""
+    async with _admission.slot(job.client):
+        loop = asyncio.get_running_loop()
+        executor = app.state.executor
+        try:
+            if job.render_options is not None:
+                job.info = await loop.run_in_executor(
+                    app.state.executor, _rerender_job,
+                    job.id, str(job.input_path), str(job.output_path), app.state.progress,
+                    str(job.landmarks_path), {**job.render_options, "frame_size": job.frame_size},
+                )
+            else:
+                await _process_upload(app, job)
+            # Only needed to merge segments; arrays are not JSON
+            job.info.pop("timing_samples", None)
+            job.state = "completed"
+            _record_memory(job)
+            if "timings" in job.info:
+                _log_timings(job)
+        except Exception as e:
+            if isinstance(e, BrokenProcessPool):
+                _replace_broken_executor(app, executor)
+            job.output_path.unlink(missing_ok=True)
+            if job.render_options is None:
+                job.landmarks_path.unlink(missing_ok=True)
+            job.error = str(e)
+            job.state = "failed"
+        finally:
+            if job.input_path != job.source_path:
+                if job.state == "completed" and KEEP_SOURCES:
+                    _keep_source(job)
+                else:
+                    job.input_path.unlink(missing_ok=True)
+            _sync_progress(app, job)
+            for key in _progress_keys(job):
+                app.state.progress.pop(key, None)
+            job.finished_at = time.time()
+            _metrics.observe_job(job)
+
+
+def _replace_broken_executor(app: FastAPI, broken: Executor):
+    """Swaps in a fresh worker pool once a worker process has died (e.g. OOM-killed).
+
+    A ProcessPoolExecutor that lost a worker refuses all further work, so without this every
+    later job would fail until a restart. Jobs that hit the same broken pool only replace it once.
+    """
+    if app.state.executor is not broken:
+        return
+    logger.error("A worker process died; replacing the worker pool")
+    broken.shutdown(wait=False, cancel_futures=True)
+    app.state.executor = _create_executor()
+    # Not ready until the new workers have loaded their models; warm-up clears the error
+    app.state.readiness.update(ready=False, error="A worker process died; restarting the worker pool")
+    app.state.warm_up.cancel()
+    app.state.warm_up = asyncio.create_task(_warm_up_workers(app))
+
+
+def _record_memory(job: Job):
+    """Adds the memory estimate the job was admitted with next to its measured peak RSS."""
+    memory = job.info.setdefault("memory", {})
+    memory.update(
+        estimate_mb=job.memory_estimate_mb,
+        budget_mb=JOB_MEMORY_BUDGET_MB or None,
+        downscaled=job.frame_size is not None,
+    )
+    logger.info(
+        "Job %s memory: estimated %s MB%s, peak RSS %s MB (%s MB before the job)",
+        job.id, job.memory_estimate_mb, f" at {job.frame_size[0]}x{job.frame_size[1]}" if job.frame_size else "",
+        memory.get("peak_rss_mb"), memory.get("baseline_rss_mb"),
+    )
+
+
+def _log_timings(job: Job):
+    stages = ", ".join(
+        f"{stage} {t['p50_ms']:.1f}/{t['p95_ms']:.1f}/{t['max_ms']:.1f}" for stage, t in job.info["timings"].items()
+    )
+    logger.info("Job %s stage timings in ms (p50/p95/max): %s", job.id, stages)
+
+
+def _keep_source(job: Job):
+    """Moves a processed upload into SOURCE_DIR, named by its hash, for later re-renders."""
+    source_path = SOURCE_DIR / f"{job.upload_hash}{job.input_path.suffix}"
+    os.replace(job.input_path, source_path)
+    job.source_path = source_path
+
+
+def _start_job(app: FastAPI, job: Job):
+    task = asyncio.create_task(_run_job(app, job))
+    _job_tasks.add(task)
+    task.add_done_callback(_job_tasks.discard)
+
+
+KEYPOINT_FORMATS = {
+    "npz": "application/octet-stream",
+    "parquet": "application/vnd.apache.parquet",
+    "json": "application/json",
+}
+
+
+def _export_keypoints(landmarks_path: str, fps: float, fmt: str) -> bytes:
+    """Serialises a saved landmark track with per-frame timestamps.
+
+    ``npz`` holds the (frames, 33, 4) array as is; ``parquet`` is a long table with one
+    row per frame and landmark. Both are built from whole arrays in a single write.
+    """
+    landmarks = np.load(landmarks_path)
+    frames = len(landmarks)
+    timestamps = np.arange(frames, dtype=np.float64) / fps
+    buffer = io.BytesIO()
+    if fmt == "npz":
+        # Uncompressed: noisy float32 landmarks barely shrink and compressing costs ~30x the write
+        np.savez(buffer, landmarks=landmarks, timestamps=timestamps, fps=np.float64(fps))
+    elif fmt == "parquet":
+        count = landmarks.shape[1]
+        flat = landmarks.reshape(-1, 4)
+        table = pa.table({
+            "frame": np.repeat(np.arange(frames, dtype=np.int32), count),
+            "timestamp": np.repeat(timestamps, count),
+            "landmark": np.tile(np.arange(count, dtype=np.int8), frames),
+            "x": flat[:, 0], "y": flat[:, 1], "z": flat[:, 2], "visibility": flat[:, 3],
+        })
+        # Dictionary encoding does nothing for float columns but doubles the write time
+        pq.write_table(table, buffer, compression="zstd", use_dictionary=False)
+    else:
+        detected = ~np.isnan(landmarks[:, 0, 0])
+        buffer.write(json.dumps({
             "fps": fps,
-            "width": output_width,
-            "height": height,
-        }
+            "timestamps": timestamps.tolist(),
+            "landmarks": [kp.tolist() if ok else None for kp, ok in zip(landmarks, detected)],
+        }).encode())
+    return buffer.getvalue()
 
-    def __del__(self):
-        if hasattr(self, "_pose"):
-            self._pose.close()
+
+def _job_status(app: FastAPI, job: Job) -> dict:
+    if job.finished_at is None and _sync_progress(app, job):
+        job.state = "running"
+    done, total = job.progress
+    fps = eta = None
+    if job.started_at is not None and done:
+        elapsed = (job.finished_at or time.time()) - job.started_at
+        if elapsed > 0:
+            rate = done / elapsed
+            fps = round(rate, 1)
+            if job.finished_at is None and total:
+                eta = round((total - done) / rate, 1)
+    return {
+        "job_id": job.id,
+        "state": job.state,
+        "progress": {
+            "frames_done": done,
+            "total_frames": total,
+            "percent": round(100 * done / total, 1) if total else None,
+            "fps": fps,
+            "eta_seconds": eta,
+        },
+        "error": job.error,
+    }
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def _job_events(request: Request, job: Job):
+    """Yields ``progress`` events as the job advances, then one ``completed`` or ``failed`` event."""
+    last = None
+    last_sent = time.monotonic()
+    while not await request.is_disconnected():
+        status = _job_status(request.app, job)
+        if job.finished_at is not None:
+            if job.state == "completed":
+                status["result"] = _job_result(job)
+            yield _sse(job.state, status)
+            return
+        snapshot = (status["state"], status["progress"]["frames_done"], status["progress"]["total_frames"])
+        if snapshot != last:
+            yield _sse("progress", status)
+            last, last_sent = snapshot, time.monotonic()
+        elif time.monotonic() - last_sent >= SSE_KEEPALIVE_SECONDS:
+            yield ": keep-alive\n\n"
+            last_sent = time.monotonic()
+        await asyncio.sleep(PROGRESS_INTERVAL)
+
+
+def _job_result(job: Job) -> dict:
+    output_path = f"processed/{job.output_path.name}" if job.output_mode != "none" else None
+    return {"output_path": output_path, "info": job.info, "cached": job.cached}
+
+
+class _LatestFrame:
+    """A one-slot mailbox: a new frame replaces one that has not been picked up yet.
+
+    Live clients send frames faster than inference may run; keeping only the newest
+    bounds latency instead of letting a backlog build up.
+    """
+
+    def __init__(self):
+        self._item = None
+        self._ready = asyncio.Event()
+        self.dropped = 0
+        self.closed = False
+
+    def put(self, item):
+        if self._item is not None:
+            self.dropped += 1
+        self._item = item
+        self._ready.set()
+
+    def close(self):
+        self.closed = True
+        self._ready.set()
+
+    async def get(self):
+        """The newest frame, waiting for one if needed; None once the sender has gone."""
+        while self._item is None:
+            if self.closed:
+                return None
+            self._ready.clear()
+            await self._ready.wait()
+        item, self._item = self._item, None
+        return item
+
+
+# Processors for live sessions, created on the first connection and kept separate from the
+# job workers so a busy batch queue never delays live frames
+_live_pool: Optional[ProcessorPool] = None
+_live_pool_lock = threading.Lock()
+_live_sessions = 0
+
+
+def _get_live_pool() -> ProcessorPool:
+    global _live_pool
+    with _live_pool_lock:
+        if _live_pool is None:
+            _live_pool = ProcessorPool(LIVE_MAX_SESSIONS)
+        return _live_pool
+
+
+def _live_inference(scheduler: AdaptiveScheduler, data: bytes) -> dict:
+    """Decodes one JPEG/WebP frame and runs it through the session's pose tracker."""
+    started = time.perf_counter()
+    frame = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    decoded = time.perf_counter()
+    if frame is None:
+        return {"type": "error", "detail": "Could not decode frame (expected JPEG or WebP)"}
+    keypoints, skipped = scheduler.detect(frame)
+    h, w = frame.shape[:2]
+    return {
+        "type": "pose",
+        "width": w,
+        "height": h,
+        "landmarks": None if keypoints is None else np.round(keypoints, 4).tolist(),
+        "skipped": skipped,
+        "quality": scheduler.report(),
+        "latency_ms": {
+            "decode": round((decoded - started) * 1000, 2),
+            "inference": round((time.perf_counter() - decoded) * 1000, 2),
+        },
+    }
+
+
+def _end_live_session(scheduler: AdaptiveScheduler):
+    scheduler.close()
+    _live_pool.release(scheduler.processor)
+
+
+async def _receive_frames(websocket: WebSocket, frames: _LatestFrame):
+    """Feeds binary messages into ``frames`` (text messages are ignored) until the client leaves."""
+    index = 0
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            if message.get("bytes"):
+                frames.put((index, time.perf_counter(), message["bytes"]))
+                index += 1
+    finally:
+        frames.close()
 
 
 @app.get("/", response_class=HTMLResponse)
@@ -144,32 +2367,217 @@ async def home(request: Request):
 
 
 @app.post("/process")
-async def process_video(file: UploadFile = File(...)):
-    if not file.content_type.startswith("video/"):
-        raise HTTPException(status_code=400, detail="File must be a video")
+async def process_video(
+    request: Request, file: UploadFile = File(...), output_mode: OutputMode = Form(OUTPUT_MODE)
+):
+    job = await _save_upload(file, output_mode)
+    _claim_admission(request, job)
+    await _run_job(request.app, job)
+    _jobs.pop(job.id, None)
+    if job.state == "failed":
+        raise HTTPException(status_code=500, detail=f"Processing failed: {job.error}")
+    return _job_result(job)
 
+
+@app.post("/jobs", status_code=202)
+async def submit_job(
+    request: Request, file: UploadFile = File(...), output_mode: OutputMode = Form(OUTPUT_MODE)
+):
+    job = await _save_upload(file, output_mode)
+    _claim_admission(request, job)
+    _start_job(request.app, job)
+    return {
+        "job_id": job.id,
+        "status_url": f"/jobs/{job.id}",
+        "events_url": f"/jobs/{job.id}/events",
+        "result_url": f"/jobs/{job.id}/result",
+    }
+
+
+@app.get("/jobs/{job_id}")
+async def job_status(request: Request, job_id: str):
+    return _job_status(request.app, _get_job(job_id))
+
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(request: Request, job_id: str):
+    """Streams the job's progress as Server-Sent Events until it completes or fails."""
+    job = _get_job(job_id)
+    return StreamingResponse(
+        _job_events(request, job),
+        media_type="text/event-stream",
+        # Stop reverse proxies (nginx) from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/jobs/{job_id}/result")
+async def job_result(job_id: str):
+    job = _get_job(job_id)
+    if job.state == "failed":
+        raise HTTPException(status_code=500, detail=f"Processing failed: {job.error}")
+    if job.state != "completed":
+        raise HTTPException(status_code=409, detail=f"Job is still {job.state}")
+    return _job_result(job)
+
+
+@app.get("/jobs/{job_id}/keypoints")
+async def job_keypoints(job_id: str, format: str = "npz"):
+    """Per-frame landmarks of a completed job as ``npz``, ``parquet`` or ``json``."""
+    job = _get_job(job_id)
+    if format not in KEYPOINT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown format: {format} (expected npz, parquet or json)")
+    if format == "parquet" and not _HAS_PYARROW:
+        raise HTTPException(status_code=501, detail="Parquet export requires pyarrow")
+    if job.state != "completed":
+        raise HTTPException(status_code=409, detail=f"Job is still {job.state}")
+    if not (job.landmarks_path and job.landmarks_path.exists()):
+        raise HTTPException(status_code=404, detail="Landmarks are no longer available")
+
+    content = await asyncio.get_running_loop().run_in_executor(
+        None, _export_keypoints, str(job.landmarks_path), job.info["fps"], format
+    )
+    return Response(
+        content=content,
+        media_type=KEYPOINT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{job.id}_keypoints.{format}"'},
+    )
+
+
+@app.post("/jobs/{job_id}/rerender", status_code=202)
+async def rerender_job(request: Request, job_id: str, options: Optional[RenderOptions] = None):
+    """Redraws a completed job's video with new settings from its saved landmarks."""
+    source = _get_job(job_id)
+    if source.state != "completed":
+        raise HTTPException(status_code=409, detail=f"Job is still {source.state}")
+    if not (source.source_path and source.source_path.exists()
+            and source.landmarks_path and source.landmarks_path.exists()):
+        raise HTTPException(status_code=409, detail="Source video or landmarks are no longer available")
+
+    render_options = (options or RenderOptions()).model_dump()
+    frame_size, memory_estimate_mb = await asyncio.get_running_loop().run_in_executor(
+        None, _memory_plan, str(source.source_path), render_options["output_mode"], render_options["encoder"]
+    )
+    client = _client_id(request)
+    _admission.admit(client)
     video_id = str(uuid.uuid4())[:8]
-    temp_path = UPLOAD_DIR / f"{video_id}_temp{Path(file.filename).suffix}"
-    output_path = PROCESSED_DIR / f"{video_id}_sidebyside.mp4"
+    job = Job(
+        id=video_id,
+        input_path=source.source_path,
+        output_path=_output_path(video_id, render_options["output_mode"]),
+        landmarks_path=source.landmarks_path,
+        source_path=source.source_path,
+        render_options=render_options,
+        output_mode=render_options["output_mode"],
+        client=client,
+        frame_size=frame_size,
+        memory_estimate_mb=memory_estimate_mb,
+    )
+    _prune_jobs()
+    _jobs[job.id] = job
+    _start_job(request.app, job)
+    return {
+        "job_id": job.id,
+        "status_url": f"/jobs/{job.id}",
+        "events_url": f"/jobs/{job.id}/events",
+        "result_url": f"/jobs/{job.id}/result",
+    }
 
+
+@app.get("/live", response_class=HTMLResponse)
+async def live_page(request: Request):
+    return templates.TemplateResponse("live.html", {"request": request})
+
+
+@app.websocket("/ws/live")
+async def live_pose(websocket: WebSocket):
+    """Streams landmarks for webcam frames sent as binary JPEG/WebP messages.
+
+    Only the newest unprocessed frame is kept, so each reply reports how many frames were
+    dropped along with the queue, decode, inference and total server latency. An
+    ``AdaptiveScheduler`` degrades quality to hold LIVE_LATENCY_BUDGET_MS and each reply
+    says which degradations are active.
+    """
+    global _live_sessions
+    await websocket.accept()
+    if _live_sessions >= LIVE_MAX_SESSIONS:
+        # 1013: "try again later"
+        await websocket.close(code=1013, reason="Too many live sessions")
+        return
+
+    _live_sessions += 1
+    loop = asyncio.get_running_loop()
+    frames = _LatestFrame()
+    processor = None
+    receiver = None
     try:
-        with temp_path.open("wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        processor = DanceSkeletonProcessor()
-        info = processor.process_video(str(temp_path), str(output_path))
-    except Exception as e:
-        temp_path.unlink(missing_ok=True)
-        output_path.unlink(missing_ok=True)
-        raise HTTPException(status_code=500, detail=f"Processing failed: {e}")
+        pool = await loop.run_in_executor(None, _get_live_pool)
+        processor = await loop.run_in_executor(None, pool.acquire)
+        scheduler = AdaptiveScheduler(processor)
+        await websocket.send_json({"type": "session", "connections": processor._connections.tolist()})
+        receiver = asyncio.create_task(_receive_frames(websocket, frames))
+        while (item := await frames.get()) is not None:
+            index, received_at, data = item
+            started = time.perf_counter()
+            reply = await loop.run_in_executor(None, _live_inference, scheduler, data)
+            reply["frame"] = index
+            reply["dropped"] = frames.dropped
+            if "latency_ms" in reply:
+                reply["latency_ms"]["queue"] = round((started - received_at) * 1000, 2)
+                reply["latency_ms"]["total"] = round((time.perf_counter() - received_at) * 1000, 2)
+            await websocket.send_json(reply)
+    except WebSocketDisconnect:
+        pass
     finally:
-        temp_path.unlink(missing_ok=True)
-
-    return {"output_path": f"processed/{output_path.name}", "info": info}
+        _live_sessions -= 1
+        if receiver is not None:
+            receiver.cancel()
+        if processor is not None:
+            # Submitted before any cancellation can interrupt the await, so the processor always returns
+            await loop.run_in_executor(None, _end_live_session, scheduler)
 
 
 @app.get("/health")
-async def health_check():
-    return {"status": "healthy", "mediapipe_available": _HAS_MEDIAPIPE}
+async def health_check(request: Request):
+    return {
+        "status": "healthy",
+        "mediapipe_available": _HAS_MEDIAPIPE,
+        "ready": request.app.state.readiness["ready"],
+    }
+
+
+@app.get("/health/live")
+async def liveness():
+    """Liveness: the process is up and the event loop is serving requests."""
+    return {"status": "alive"}
+
+
+@app.get("/health/ready")
+async def readiness(request: Request):
+    """Readiness: every worker has loaded its model and answered a dummy inference."""
+    state = request.app.state.readiness
+    if state["error"]:
+        return JSONResponse(status_code=503, content={"status": "failed", "error": state["error"]})
+    if not state["ready"]:
+        return JSONResponse(status_code=503, content={"status": "warming_up"})
+    return {"status": "ready", "warm_up_s": state["warm_up_s"], "workers": state["workers"]}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics(request: Request):
+    """Prometheus metrics: job counters, throughput histograms and current load."""
+    frames = _metrics.counters["dance_frames_processed_total"]
+    gauges = {
+        "dance_jobs_queued": ("Admitted jobs waiting for a processing slot, uploads in progress included.",
+                              _admission.waiting),
+        "dance_jobs_running": ("Jobs holding a processing slot.", _admission.running),
+        "dance_workers": ("Size of the processing worker pool.", PROCESS_WORKERS),
+        "dance_detection_ratio": (
+            "Share of processed frames with a detected pose.",
+            _metrics.counters["dance_frames_with_pose_total"] / frames if frames else 0,
+        ),
+    }
+    return PlainTextResponse(_metrics.render(gauges), media_type="text/plain; version=0.0.4")
 
 
 if __name__ == "__main__":